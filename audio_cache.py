@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = '.audio_cache'
+
+# (path, size, mtime) -> content hash, so a file is hashed once per process
+_hash_memo = {}
+
+
+def content_hash(path, chunk_size=1 << 20):
+    """
+    SHA-256 of a file's content.
+
+    Parameters:
+    path (str): File to hash
+    chunk_size (int): Bytes read at a time
+
+    Returns:
+    str: Hex digest
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _hash_memo:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+
+class AudioCache:
+    """
+    On-disk cache of decoded audio.
+
+    Decoded float32 arrays are stored as .npy files keyed by the source file's content
+    hash, the sample rate and the mono flag, and reopened memory-mapped, so analyzing a
+    track again (with any scale or level settings) skips decoding and resampling.
+    When the cache grows over max_bytes the least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=4 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path, sr=22050, mono=True):
+        return f"{content_hash(path)}-{sr or 'native'}-{'mono' if mono else 'multi'}"
+
+    def load(self, path, sr=22050, mono=True):
+        """
+        Drop-in replacement for librosa.load(path, sr=sr, mono=mono).
+
+        Returns:
+        tuple: (y - read-only np.memmap of the decoded signal, sample rate)
+        """
+        key = self.key(path, sr=sr, mono=mono)
+        array_path = os.path.join(self.cache_dir, key + '.npy')
+        meta_path = os.path.join(self.cache_dir, key + '.json')
+
+        if os.path.exists(array_path) and os.path.exists(meta_path):
+            # Touch the entry so eviction sees it as recently used
+            os.utime(array_path)
+            with open(meta_path) as f:
+                sample_rate = json.load(f)['sample_rate']
+            return np.load(array_path, mmap_mode='r'), sample_rate
+
+        import librosa
+        y, sample_rate = librosa.load(path, sr=sr, mono=mono)
+
+        # Write under a temporary name first so readers never see a partial file
+        tmp_path = f"{array_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, y.astype(np.float32, copy=False))
+        os.replace(tmp_path, array_path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'source': os.path.abspath(path), 'sample_rate': sample_rate}, f)
+        os.replace(tmp_path, meta_path)
+
+        self.evict(keep=array_path)
+        return np.load(array_path, mmap_mode='r'), sample_rate
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npy'):
+                array_path = os.path.join(self.cache_dir, name)
+                stat = os.stat(array_path)
+                entries.append((stat.st_mtime, stat.st_size, array_path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, array_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if array_path == keep:
+                continue
+            try:
+                os.remove(array_path)
+                os.remove(array_path[:-len('.npy')] + '.json')
+            except OSError:
+                # Still memory-mapped (Windows) or removed by another process
+                continue
+            total -= size
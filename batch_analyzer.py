@@ -0,0 +1,172 @@
+import argparse
+import glob
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from audio_cache import AudioCache
+from song_analyzer import SongAnalyzer
+
+DEFAULT_STORE = 'batch_results.jsonl'
+
+
+def list_songs(songs_dir=None, manifest=None):
+    """
+    Songs of a batch as SongAnalyzer.run names (the mp3 path without its extension).
+
+    Parameters:
+    songs_dir (str): Directory holding <song>.mp3 files
+    manifest (str): Text file with one song per line, relative to the manifest's directory
+
+    Returns:
+    tuple: (base directory the names are relative to, list of song names)
+    """
+    if manifest:
+        base_dir = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as f:
+            lines = [line.strip() for line in f]
+        songs = [line[:-len('.mp3')] if line.endswith('.mp3') else line
+                 for line in lines if line and not line.startswith('#')]
+    else:
+        base_dir = os.path.abspath(songs_dir)
+        songs = sorted(os.path.basename(path)[:-len('.mp3')] for path in glob.glob(os.path.join(base_dir, '*.mp3')))
+    return base_dir, songs
+
+
+def load_done(store_path):
+    """
+    Songs that already have an ok result in the store.
+
+    A line cut short by a crash is ignored, so its song runs again.
+    """
+    done = set()
+    if not os.path.exists(store_path):
+        return done
+    with open(store_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('status') == 'ok':
+                done.add(record['song'])
+    return done
+
+
+def append_record(store_path, record):
+    with open(store_path, 'a') as f:
+        f.write(json.dumps(record, default=to_json) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def analyze_song(song_name, analyzer_kwargs, separate=False):
+    """
+    Analyze one song - module level so the process pool can run it.
+
+    Returns:
+    dict: The song's record, with status 'ok', its segments and stats or 'error' and the traceback
+    """
+    start = time.perf_counter()
+    try:
+        analyzer = SongAnalyzer(**analyzer_kwargs)
+        plots = analyzer.plot_dir is not None
+        segments, stats = analyzer.run(song_name=song_name, separate=separate, show_sub_plots=plots,
+                                       show_port=plots, return_stats=True)
+        record = {'song': song_name, 'status': 'ok', 'segments': segments, 'stats': stats}
+    except Exception as e:
+        record = {'song': song_name, 'status': 'error', 'error': repr(e), 'traceback': traceback.format_exc()}
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run_batch(songs, store_path, analyzer_kwargs, workers=None, separate=False):
+    """
+    Analyze songs across a process pool, appending each result to store_path as it finishes.
+
+    Songs with an ok result in the store are skipped, so an interrupted batch resumes
+    where it stopped. Only this process writes the store.
+
+    Returns:
+    list: Records of the songs analyzed in this run
+    """
+    done = load_done(store_path)
+    pending = [song for song in songs if song not in done]
+    print(f"{len(songs)} songs, {len(songs) - len(pending)} already done, {len(pending)} to analyze")
+
+    records = []
+    if not pending:
+        return records
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_song, song, analyzer_kwargs, separate) for song in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            append_record(store_path, record)
+            records.append(record)
+            print(f"[{len(records)}/{len(pending)}] {record['song']} - {record['status']} ({record['seconds']} sec)")
+    return records
+
+
+def report(records):
+    """
+    Print per-song timing and the failures of a batch.
+    """
+    if not records:
+        return
+    print("\nSong timing (sec):")
+    for record in sorted(records, key=lambda r: r['seconds'], reverse=True):
+        print(f"  {record['seconds']:10.3f}  {record['status']:5}  {record['song']}")
+
+    failed = [record for record in records if record['status'] != 'ok']
+    total = sum(record['seconds'] for record in records)
+    print(f"\n{len(records) - len(failed)} ok, {len(failed)} failed, {total:.3f} sec of analysis")
+    for record in failed:
+        print(f"  {record['song']}: {record['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze a library of songs with SongAnalyzer.run')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--songs_dir', type=str, help='Directory of <song>.mp3 files')
+    source.add_argument('--manifest', type=str, help='Text file with one song per line')
+    parser.add_argument('--store', type=str, default=DEFAULT_STORE, help='Append-only JSONL results file')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default - number of CPUs)')
+    parser.add_argument('--separate', action='store_true', help='Run demucs on every song first')
+    parser.add_argument('--scale', type=str, default='Relative', help='Scale to use')
+    parser.add_argument('--energy_levels', type=int, default=5, help='Number of levels')
+    parser.add_argument('--min_seg_length_sec', type=int, default=5, help='Min Segment length in sec')
+    parser.add_argument('--max_seg_length_sec', type=int, default=40, help='Max Segment length in sec')
+    parser.add_argument('--normalize_values', action='store_true', help='Report normalized powers')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Decoded audio cache directory')
+    parser.add_argument('--plot_dir', type=str, default=None, help='Write every stem\'s plot (png) here')
+    args = parser.parse_args()
+
+    store_path = os.path.abspath(args.store)
+    base_dir, songs = list_songs(songs_dir=args.songs_dir, manifest=args.manifest)
+    analyzer_kwargs = {'scale': args.scale, 'number_of_levels': args.energy_levels,
+                       'min_seg_length_sec': args.min_seg_length_sec,
+                       'max_seg_length_sec': args.max_seg_length_sec,
+                       'normalize_values': args.normalize_values}
+    if args.cache_dir:
+        analyzer_kwargs['audio_cache'] = AudioCache(os.path.abspath(args.cache_dir))
+    if args.plot_dir:
+        analyzer_kwargs['plot_dir'] = os.path.abspath(args.plot_dir)
+
+    # run() reads <song>.mp3 and separated/htdemucs/<song>/ relative to the working directory
+    os.chdir(base_dir)
+    records = run_batch(songs, store_path, analyzer_kwargs, workers=args.workers, separate=args.separate)
+    report(records)
+
+
+if __name__ == '__main__':
+    main()
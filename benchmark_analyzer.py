@@ -0,0 +1,248 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from Seperate_to_json import methods, reduce_windows
+from song_analyzer import SongAnalyzer
+
+DEFAULT_MINUTES = [1, 5, 20, 60]
+DEFAULT_OUTPUT = 'benchmark_results.json'
+STEMS = ['bass', 'drums', 'vocals', 'other']
+# Importing song_analyzer must stay under the budget and must not load these
+IMPORT_BUDGET_SEC = 0.5
+HEAVY_MODULES = ['librosa', 'pandas', 'matplotlib', 'scipy']
+
+
+def synthetic_track(minutes, sample_rate=22050, silence_sec=2.0, seed=0):
+    """
+    Noise track with controlled length, dynamics and opening silence.
+
+    The track is split into sections of 5 to 40 seconds, each played at a random loudness,
+    so the analyzer finds segments of different powers like in a real song.
+
+    Parameters:
+    minutes (float): Track length
+    sample_rate (int): Sample rate
+    silence_sec (float): Opening silence length
+    seed (int): Random seed - the same arguments always give the same track
+
+    Returns:
+    np.ndarray: float32 mono signal
+    """
+    rng = np.random.default_rng(seed)
+    length = int(minutes * 60 * sample_rate)
+    gains = np.zeros(length, dtype=np.float32)
+    start = int(silence_sec * sample_rate)
+    while start < length:
+        end = start + int(rng.uniform(5, 40) * sample_rate)
+        gains[start:end] = rng.uniform(0.05, 0.9)
+        start = end
+    return (rng.standard_normal(length).astype(np.float32) * 0.3 * gains).clip(-1, 1)
+
+
+def write_song(work_dir, minutes, sample_rate=22050):
+    """
+    Write a synthetic song for SongAnalyzer.run - <song>.mp3 and its separated stems.
+
+    Files that already exist are reused, so the tracks are encoded once per work_dir.
+
+    Returns:
+    str: Song name (relative to work_dir)
+    """
+    import soundfile as sf
+
+    song_name = f"synthetic_{minutes:g}min"
+    stem_dir = os.path.join(work_dir, 'separated', 'htdemucs', song_name)
+    os.makedirs(stem_dir, exist_ok=True)
+    paths = [os.path.join(work_dir, f"{song_name}.mp3")] + [os.path.join(stem_dir, f"{stem}.mp3") for stem in STEMS]
+    for i, path in enumerate(paths):
+        if not os.path.exists(path):
+            sf.write(path, synthetic_track(minutes, sample_rate, silence_sec=2.0 + i, seed=i), sample_rate)
+    return song_name
+
+
+def import_time(module='song_analyzer', repeat=3):
+    """
+    Time to import a module in a fresh interpreter, best of `repeat`.
+
+    Returns:
+    tuple: (seconds, heavy modules the import loaded)
+    """
+    code = ("import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            f"import {module}\n"
+            "seconds = time.perf_counter() - start\n"
+            f"print(json.dumps([seconds, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))")
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return min(runs)
+
+
+def check_import(budget=IMPORT_BUDGET_SEC, repeat=3):
+    """
+    Check the song_analyzer import against the budget.
+
+    Returns:
+    tuple: (seconds, heavy modules loaded, list of problems - empty when within budget)
+    """
+    seconds, heavy = import_time(repeat=repeat)
+    problems = []
+    if seconds > budget:
+        problems.append(f"import song_analyzer took {seconds:.3f} sec, the budget is {budget} sec")
+    if heavy:
+        problems.append(f"import song_analyzer loaded {', '.join(heavy)}")
+    return seconds, heavy, problems
+
+
+def best_time(function, repeat=3):
+    """
+    Best wall time of `repeat` calls, with the analyzer's prints silenced.
+    """
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_length(work_dir, minutes, repeat=3, skip_run=False):
+    """
+    Time the analysis stages on a synthetic song of the given length.
+
+    Returns:
+    dict: Stage name -> best time in seconds
+    """
+    import librosa
+
+    song_name = write_song(work_dir, minutes)
+    track = os.path.join(work_dir, f"{song_name}.mp3")
+    y, sample_rate = librosa.load(track)
+    y_power = np.abs(y)
+
+    analyzer = SongAnalyzer(scale='Relative')
+    analyzer.sample_rate = sample_rate
+    analyzer.levels_rate = sample_rate
+    ref_values = analyzer.get_quantizer_vals(values=y_power, instrument='main')
+    analyzer.ref_values = ref_values
+
+    timings = {
+        'get_quantizer_vals': best_time(lambda: analyzer.get_quantizer_vals(values=y_power, instrument='main'), repeat),
+        'remove_opening_silence': best_time(lambda: analyzer.remove_opening_silence(
+            powers=y_power, instrument='main', ref_list=ref_values), repeat),
+        'segment_powers': best_time(lambda: analyzer.segment_powers(y_power=y_power, instrument='main'), repeat),
+        'single_track_run': best_time(lambda: SongAnalyzer(scale='Relative').single_track_run(
+            track=track, instrument='main', show_plot=False), repeat),
+    }
+    if not skip_run:
+        # run() opens <song>.mp3 and separated/htdemucs/<song>/ relative to the working directory
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            timings['run'] = best_time(lambda: SongAnalyzer(scale='Relative').run(song_name=song_name,
+                                                                                   show_port=False), repeat)
+        finally:
+            os.chdir(cwd)
+
+    steps = sample_rate // 2
+    for method in methods:
+        timings[f"reduce_windows_{method}"] = best_time(lambda: reduce_windows(y_power, steps, method), repeat)
+    return timings
+
+
+def compare(results, baseline, threshold, min_delta=0.005):
+    """
+    Compare results to a baseline file's results.
+
+    Stages faster than min_delta seconds are timer noise, they only count as slower
+    when they lose more than min_delta as well.
+
+    Returns:
+    list: (length, stage, baseline sec, new sec) of every stage more than threshold slower
+    """
+    slower = []
+    for length, timings in results.items():
+        for stage, seconds in timings.items():
+            base = baseline.get(length, {}).get(stage)
+            if base is None:
+                continue
+            ratio = seconds / base if base else float('inf')
+            print(f"  {length:>6} {stage:32} {base:10.4f} -> {seconds:10.4f}  x{ratio:.2f}")
+            if seconds > base * (1 + threshold) and seconds - base > min_delta:
+                slower.append((length, stage, base, seconds))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the SongAnalyzer hot paths on synthetic songs')
+    parser.add_argument('--minutes', type=float, nargs='+', default=DEFAULT_MINUTES, help='Song lengths in minutes')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage, the best one is kept')
+    parser.add_argument('--work_dir', type=str, default='benchmark_audio', help='Where synthetic songs are written')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT, help='JSON results file')
+    parser.add_argument('--baseline', type=str, default=None, help='JSON results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown (0.2 - 20%% slower)')
+    parser.add_argument('--min_delta', type=float, default=0.005, help='Slowdowns under it (sec) are ignored')
+    parser.add_argument('--import_budget', type=float, default=IMPORT_BUDGET_SEC,
+                        help='Allowed seconds to import song_analyzer')
+    parser.add_argument('--import_only', action='store_true', help='Only check the import budget')
+    parser.add_argument('--skip_run', action='store_true', help="Don't time SongAnalyzer.run (5 decodes per song)")
+    args = parser.parse_args()
+
+    import_seconds, heavy, import_problems = check_import(args.import_budget, repeat=args.repeat)
+    print(f"import song_analyzer: {import_seconds:.3f} sec (budget {args.import_budget} sec)")
+    for problem in import_problems:
+        print(f"  {problem}")
+    if args.import_only:
+        sys.exit(1 if import_problems else 0)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    results = {}
+    for minutes in args.minutes:
+        length = f"{minutes:g}min"
+        print(f"Benchmarking {length}")
+        results[length] = benchmark_length(args.work_dir, minutes, repeat=args.repeat, skip_run=args.skip_run)
+        for stage, seconds in results[length].items():
+            print(f"  {stage:32} {seconds:10.4f} sec")
+
+    output = {
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                    'numpy': np.__version__, 'cpus': os.cpu_count()},
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'repeat': args.repeat,
+        'import': {'seconds': import_seconds, 'budget': args.import_budget, 'heavy_modules': heavy},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=4)
+    print(f"Results written to {args.output}")
+
+    failed = bool(import_problems)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared to {args.baseline}:")
+        slower = compare(results, baseline['results'], args.threshold, min_delta=args.min_delta)
+        if slower:
+            print(f"{len(slower)} stages are more than {args.threshold:.0%} slower than the baseline:")
+            for length, stage, base, seconds in slower:
+                print(f"  {length} {stage}: {base:.4f} -> {seconds:.4f} sec")
+            failed = True
+        else:
+            print("No slowdowns")
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch_analyzer import list_songs
+from stem_manager import STEMS, StemManager
+from streaming import LevelSketch, stream_blocks
+
+DEFAULT_TABLES = 'scale_tables.json'
+
+
+class RunningMoments:
+    """
+    Count, mean and variance of a stream of values, mergeable across workers.
+
+    Blocks and partial states are combined with Chan's parallel update, which stays
+    accurate over billions of samples where summing squares would not.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared distances from the mean
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        block = RunningMoments()
+        block.count = len(values)
+        if block.count:
+            block.mean = float(values.mean())
+            block.m2 = float(((values - block.mean) ** 2).sum())
+        self.merge(block)
+
+    def merge(self, other):
+        count = self.count + other.count
+        if not count:
+            return self
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def std(self):
+        return (self.m2 / self.count) ** 0.5 if self.count else 0.0
+
+
+def corpus_tracks(songs, stem_manager=None):
+    """
+    (instrument, path) of every stem and main track of the songs - songs without stems are skipped.
+    """
+    stem_manager = stem_manager or StemManager()
+    tracks = []
+    for song_name in songs:
+        try:
+            paths = stem_manager.stem_paths(f"{song_name}.mp3", separate=False)
+        except FileNotFoundError as e:
+            print(f"Skipping {song_name}: {e}")
+            continue
+        tracks.extend((instrument, paths[instrument]) for instrument in STEMS + ['main'])
+    return tracks
+
+
+def calibrate_track(instrument, path, sensitivity_power=0.001, block_sec=30):
+    """
+    Partial calibration state of one track - module level so the process pool can run it.
+
+    The track is streamed, so memory does not depend on its length.
+
+    Returns:
+    tuple: (instrument, LevelSketch, RunningMoments) or (instrument, None, error) if it can't be read
+    """
+    sketch = LevelSketch(number_of_levels=1, sensitivity_power=sensitivity_power)
+    moments = RunningMoments()
+    try:
+        for block in stream_blocks(path, block_sec=block_sec):
+            powers = np.abs(block)
+            sketch.add(powers)
+            moments.add(powers)
+    except Exception as e:
+        return instrument, None, f"{path}: {e!r}"
+    return instrument, sketch, moments
+
+
+def calibrate(tracks, workers=None, sensitivity_power=0.001, points=60, block_sec=30):
+    """
+    Build the scale tables of a corpus.
+
+    Every track is reduced to a sketch and running moments in a worker, and the partial
+    states are merged per instrument in this process.
+
+    Returns:
+    dict: {'percentile_scale': {instrument: [0, quantiles...]}, 'standard_values': {instrument: {'mu', 'sigma'}}, ...}
+    """
+    sketches = {}
+    moments = {}
+    files = {}
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        args = [(instrument, path, sensitivity_power, block_sec) for instrument, path in tracks]
+        for instrument, sketch, track_moments in pool.map(calibrate_track, *zip(*args)):
+            if sketch is None:
+                errors.append(track_moments)
+                continue
+            sketches.setdefault(instrument, LevelSketch(1, sensitivity_power=sensitivity_power)).merge(sketch)
+            moments.setdefault(instrument, RunningMoments()).merge(track_moments)
+            files[instrument] = files.get(instrument, 0) + 1
+
+    tables = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'sensitivity_power': sensitivity_power,
+              'files': files, 'errors': errors, 'percentile_scale': {}, 'standard_values': {}}
+    for instrument, sketch in sketches.items():
+        quantiles = sketch.quantiles([i / points for i in range(1, points)])
+        if quantiles is not None:
+            tables['percentile_scale'][instrument] = [0] + quantiles
+        tables['standard_values'][instrument] = {'mu': moments[instrument].mean, 'sigma': moments[instrument].std}
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate the Percentile and Normal scales on a corpus of songs')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--songs_dir', type=str, help='Directory of <song>.mp3 files with separated stems')
+    source.add_argument('--manifest', type=str, help='Text file with one song per line')
+    parser.add_argument('--output', type=str, default=DEFAULT_TABLES, help='Tables file for SongAnalyzer(tables_path=...)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default - number of CPUs)')
+    parser.add_argument('--points', type=int, default=60, help='Values per percentile_scale table')
+    parser.add_argument('--sensitivity_power', type=float, default=0.001, help='Values below it are ignored as silence')
+    parser.add_argument('--block_sec', type=float, default=30, help='Seconds of audio read at a time')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    base_dir, songs = list_songs(songs_dir=args.songs_dir, manifest=args.manifest)
+    # Song names and stem folders are relative to the songs' folder, like in run()
+    os.chdir(base_dir)
+    tables = calibrate(corpus_tracks(songs), workers=args.workers, sensitivity_power=args.sensitivity_power,
+                       points=args.points, block_sec=args.block_sec)
+
+    with open(output, 'w') as f:
+        json.dump(tables, f, indent=4)
+    print(f"Tables of {sum(tables['files'].values())} tracks written to {output}")
+    for error in tables['errors']:
+        print(f"  skipped {error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+class EnvelopeIndex:
+    """
+    Cumulative-sum index over a power envelope.
+
+    Built once per track, answers the mean of any [start, end) range in constant time
+    instead of re-reading the samples of the range.
+    """
+
+    def __init__(self, powers):
+        self.length = len(powers)
+        # float64 accumulator so long tracks keep their precision
+        self.cumsum = np.zeros(self.length + 1, dtype=np.float64)
+        np.cumsum(powers, dtype=np.float64, out=self.cumsum[1:])
+
+    def sum(self, start, end):
+        start, end = self.clip(start, end)
+        return self.cumsum[end] - self.cumsum[start]
+
+    def mean(self, start, end):
+        """
+        Mean of powers[start:end], nan for an empty range (like np.mean of an empty slice).
+        """
+        start, end = self.clip(start, end)
+        if end <= start:
+            return np.nan
+        return (self.cumsum[end] - self.cumsum[start]) / (end - start)
+
+    def clip(self, start, end):
+        start = min(max(start, 0), self.length)
+        end = min(max(end, start), self.length)
+        return start, end
+
+
+class WindowMedians:
+    """
+    Medians of the analyzer's min_width windows, computed once per track.
+
+    A window is a [lo, hi) range of the envelope, the same range the analyzer slices
+    with powers[lo:hi]. Full-width windows starting on the hop grid (lo % hop == 0) are
+    computed up front with a running median: a sorted copy of the current window that
+    drops the samples leaving it and inserts the samples entering it on every hop.
+
+    exact=True:  every lookup returns np.median(powers[lo:hi]). Windows off the grid are
+                 computed on first use and memoized, repeated binary-search probes are free.
+    exact=False: full-width windows are snapped to the nearest grid window, so a coarse
+                 hop trades median accuracy for a much smaller table.
+
+    With scale > 1, lo and hi count frames of `scale` samples of powers (the frames of a
+    frame envelope), and every window is the median of its samples, computed on use.
+    """
+
+    def __init__(self, powers, width, hop, exact=True, scale=1):
+        self.powers = powers
+        self.width = width
+        self.hop = hop
+        self.exact = exact
+        self.scale = scale
+        self.computed = 0
+        self.memo = {}
+        self.table = self.running_medians() if hop else np.empty(0)
+
+    def running_medians(self):
+        count = (len(self.powers) - self.width) // self.hop + 1
+        if count <= 0:
+            return np.empty(0)
+        medians = []
+        window = np.sort(self.powers[:self.width])
+        for k in range(count):
+            lo = k * self.hop
+            if k and self.hop >= self.width:
+                window = np.sort(self.powers[lo:lo + self.width])
+            elif k:
+                leaving = np.sort(self.powers[lo - self.hop:lo])
+                # Equal values leave from consecutive positions of the sorted window
+                repeat = np.arange(len(leaving)) - np.searchsorted(leaving, leaving, side='left')
+                window = np.delete(window, np.searchsorted(window, leaving, side='left') + repeat)
+                entering = np.sort(self.powers[lo + self.width - self.hop:lo + self.width])
+                window = np.insert(window, np.searchsorted(window, entering), entering)
+            medians.append(self.sorted_median(window))
+        self.computed += count
+        return np.array(medians)
+
+    @staticmethod
+    def sorted_median(window):
+        middle = len(window) // 2
+        if len(window) % 2:
+            return window[middle]
+        # Same reduction np.median uses for the two middle values
+        return np.mean(window[middle - 1:middle + 1])
+
+    def window(self, lo, hi):
+        """
+        Median of powers[lo:hi].
+        """
+        # A frame's samples - the last frame of an envelope ends with the samples
+        lo, hi = lo * self.scale, hi * self.scale
+        if lo < 0:
+            # Negative starts keep numpy's wrap-around slicing, never worth caching
+            self.computed += 1
+            return np.median(self.powers[lo:hi])
+        hi = min(hi, len(self.powers))
+        if hi - lo == self.width and len(self.table):
+            k, remainder = divmod(lo, self.hop)
+            if not self.exact:
+                k = min(int(round(lo / self.hop)), len(self.table) - 1)
+                remainder = 0
+            if remainder == 0 and k < len(self.table):
+                return self.table[k]
+        key = (lo, hi)
+        if key not in self.memo:
+            self.computed += 1
+            self.memo[key] = np.median(self.powers[lo:hi])
+        return self.memo[key]
+
+    def centered(self, center, half_width):
+        """
+        Median of the window powers[center - half_width:center + half_width].
+        """
+        return self.window(center - half_width, center + half_width)
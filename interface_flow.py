@@ -1,18 +1,60 @@
 import argparse
+import gzip
+import math
 
-from flask import Flask, render_template_string, send_from_directory
+from flask import (Blueprint, Flask, Response, abort, current_app, jsonify, render_template_string, request,
+                   send_file, url_for)
+from werkzeug.utils import safe_join
 import numpy as np
 import os
 import glob
 
+from audio_cache import AudioCache, content_hash
+from jobs import Job, JobQueue, QueueFull
+from levels import LevelPyramid, LevelTrack
+from result_cache import ResultCache
 from song_analyzer import SongAnalyzer
+from stem_manager import STEMS
 
-app = Flask(__name__)
+# Routes of the app, create_app registers them
+views = Blueprint('views', __name__)
 
 # Directory for audio files
 AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'audio')
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
+# Decoded tracks, so page reloads don't decode the track again
+AUDIO_CACHE = AudioCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.audio_cache'))
+
+# Analysis results, so page reloads with the same settings don't analyze the track again.
+# Raise RESULT_VERSION when analyze_view's result changes, results of other versions aren't read.
+RESULT_VERSION = 2
+RESULT_CACHE = ResultCache(max_entries=32,
+                           cache_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.result_cache'),
+                           version=RESULT_VERSION)
+
+# Background analyses of the job API, finished results go to the result cache. The limits are per process.
+JOBS = JobQueue(max_workers=2, max_pending=16, on_done=RESULT_CACHE.put,
+                on_failed=lambda key, error: RESULT_CACHE.clear_pending(key))
+
+# Accepted analysis settings - every distinct setting is another cached result, so they are bounded
+SCALES = ('Relative', 'Normal', 'Percentile')
+INSTRUMENTS = tuple(STEMS) + ('main',)
+MAX_ENERGY_LEVELS = 255  # levels are sent as one byte each
+MAX_SEG_LENGTH_SEC = 600
+MIN_RESOLUTION = 0.01  # sec, resolutions are rounded to it
+MAX_RESOLUTION = 10
+
+# Environment variables parse_args reads, INTERFACE_FLOW_<ARGUMENT>
+ENV_PREFIX = 'INTERFACE_FLOW_'
+
+# Audio URLs carrying the file's content hash (audio_url) never change content, browsers
+# and proxies may keep them this long without asking again
+AUDIO_MAX_AGE = 365 * 24 * 3600
+
+# Zoom pyramids of recent results, by result key - built again from the result's levels when dropped
+PYRAMIDS = ResultCache(max_entries=8)
+
 
 def get_available_instruments():
     """Get a list of available audio instrument folders"""
@@ -44,8 +86,11 @@ def get_audio_files(instrument):
     return [os.path.basename(f) for f in audio_files]
 
 
-@app.route('/')
-def index():
+def parse_args(argv=None):
+    """
+    Settings of the app. Every argument defaults to the INTERFACE_FLOW_<ARGUMENT> environment
+    variable when it is set (e.g. INTERFACE_FLOW_TRACK_PATH), so WSGI servers can configure it.
+    """
     parser = argparse.ArgumentParser()
     parser.add_argument('--track_path', type=str, help='Source path to track')
     parser.add_argument('--scale', type=str,default='Relative', help='Scale to use')
@@ -53,36 +98,357 @@ def index():
     parser.add_argument('--min_seg_length_sec', type=int,default=5, help="Min Segment length in sec")
     parser.add_argument('--max_seg_length_sec', type=int,default=40, help="Max Segment length in sec")
     parser.add_argument('--energy_levels', type=int,default=5, help="Number of levels")
-    parser.add_argument('--resolution', type=int,default=0.1, help="Display Resolution in sec")
+    parser.add_argument('--resolution', type=float,default=0.1, help="Display Resolution in sec")
+    names = vars(parser.parse_args([]))
+    parser.set_defaults(**{name: os.environ[ENV_PREFIX + name.upper()] for name in names
+                           if ENV_PREFIX + name.upper() in os.environ})
+    return parser.parse_args(argv)
+
+
+def create_app(args=None):
+    """
+    Build the app. Settings are parsed once, here: args from parse_args, or the environment
+    variables alone when None - e.g. gunicorn -w 8 'interface_flow:create_app()'.
+
+    Processes serving the same folder share analysis results and decoded tracks through the
+    .result_cache and .audio_cache folders.
+    """
+    app = Flask(__name__)
+    app.config['VIEW_ARGS'] = parse_args([]) if args is None else args
+    app.register_blueprint(views)
+    return app
+
+
+def view_params(args, overrides=None):
+    """
+    Analysis parameters of the player page - the command line arguments, with overrides
+    (e.g. a job request's fields) taking precedence.
+
+    Raises ValueError for a setting outside the accepted values (SCALES, INSTRUMENTS and the
+    limits above). The resolution is rounded to MIN_RESOLUTION.
+    """
+    overrides = overrides or {}
+    params = {'scale': str(overrides.get('scale', args.scale)),
+              # scales Relative, Normal, Percentile
+              'instrument': str(overrides.get('instrument', args.instrument)),
+              'energy_levels': int(overrides.get('energy_levels', args.energy_levels)),
+              'min_seg_length_sec': int(overrides.get('min_seg_length_sec', args.min_seg_length_sec)),
+              'max_seg_length_sec': int(overrides.get('max_seg_length_sec', args.max_seg_length_sec)),
+              'resolution': float(overrides.get('resolution', args.resolution)),  # in sec
+              'normalize_values': True}
+
+    if params['scale'] not in SCALES:
+        raise ValueError(f"scale must be one of {', '.join(SCALES)}")
+    if params['instrument'] not in INSTRUMENTS:
+        raise ValueError(f"instrument must be one of {', '.join(INSTRUMENTS)}")
+    if not 1 <= params['energy_levels'] <= MAX_ENERGY_LEVELS:
+        raise ValueError(f"energy_levels must be between 1 and {MAX_ENERGY_LEVELS}")
+    if not 1 <= params['min_seg_length_sec'] <= params['max_seg_length_sec'] <= MAX_SEG_LENGTH_SEC:
+        raise ValueError(f"Segment lengths must satisfy 1 <= min_seg_length_sec <= max_seg_length_sec <= {MAX_SEG_LENGTH_SEC}")
+    if not (math.isfinite(params['resolution']) and MIN_RESOLUTION <= params['resolution'] <= MAX_RESOLUTION):
+        raise ValueError(f"resolution must be between {MIN_RESOLUTION} and {MAX_RESOLUTION} sec")
+    params['resolution'] = round(round(params['resolution'] / MIN_RESOLUTION) * MIN_RESOLUTION, 6)
+    return params
+
+
+def analyze_view(track, params):
+    """
+    Analyze a track for the player page - module level so the job pool's processes can run it.
+
+    Returns:
+    dict: quantized_values every resolution seconds, number_of_levels, sample_rate, resolution
+          and levels (the LevelTrack's as_dict, for zooming in finer than resolution)
+    """
+    analyzer = SongAnalyzer(normalize_values=params['normalize_values'], scale=params['scale'],
+                            number_of_levels=params['energy_levels'],
+                            max_seg_length_sec=params['max_seg_length_sec'],
+                            min_seg_length_sec=params['min_seg_length_sec'],
+                            audio_cache=AUDIO_CACHE)
+    level_track = analyzer.single_track_run(track=track, instrument=params['instrument'],
+                                            show_plot=False, as_levels=True)
+    # Sample the runs directly instead of slicing a per-sample list
+    return {'quantized_values': level_track.resample(params['resolution']).tolist(),
+            'number_of_levels': analyzer.number_of_levels,
+            'sample_rate': analyzer.sample_rate,
+            'resolution': params['resolution'],
+            'levels': level_track.as_dict()}
+
+
+def view_job(track, params):
+    """
+    Job of a track's analyze_view result - finished at once when the result is cached, queued otherwise.
+    A result another process serving the app is analyzing is not analyzed again, its job reads queued.
+
+    Raises QueueFull when the queue is full.
+    """
+    key = RESULT_CACHE.key(track, params)
+    cached = RESULT_CACHE.get(key)
+    if cached is not None:
+        return JOBS.completed(key, cached)
+    job = JOBS.get(key)
+    if job is None or job.status == 'failed':
+        marker = RESULT_CACHE.pending(key)
+        if marker is not None:
+            return pending_job(marker)
+    job = JOBS.submit(key, analyze_view, track, params)
+    if job.finished is None:
+        RESULT_CACHE.mark_pending(key)
+    return job
+
+
+def pending_job(marker):
+    # Job of another process serving the app, from its pending marker - queued as far as this process knows
+    job = Job(marker['key'])
+    job.submitted = marker['submitted']
+    return job
+
+
+def view_result(track, params):
+    """
+    A track's analyze_view result when it is cached. On a miss the analysis is queued as a job
+    (shared by viewers asking for the same result) and the request doesn't wait for it.
+
+    Returns:
+    tuple: (result cache key, result, None) or (key, None, response) - 202 with the job's status
+           (poll /jobs/<id>) while it is queued or running, 429 when the queue is full, 500 when
+           the analysis failed
+    """
+    key = RESULT_CACHE.key(track, params)
+    try:
+        job = view_job(track, params)
+    except QueueFull as e:
+        return key, None, (jsonify(error=str(e)), 429)
+    if job.status == 'failed':
+        return key, None, (jsonify(job.as_dict()), 500)
+    if job.status != 'done':
+        return key, None, (jsonify(job.as_dict()), 202, {'Location': url_for('views.job_status', job_id=job.id)})
+    return key, job.result, None
+
+
+def pyramid(key, result):
+    levels = PYRAMIDS.get(key)
+    if levels is None:
+        levels = LevelPyramid(LevelTrack.from_dict(result['levels']))
+        PYRAMIDS.put(key, levels)
+    return levels
+
+
+def binary_response(levels, headers):
+    """
+    uint8 levels as an application/octet-stream response, gzip compressed when the client accepts it.
+    """
+    body = np.ascontiguousarray(levels, dtype=np.uint8).tobytes()
+    response = Response(content_type='application/octet-stream')
+    if request.accept_encodings['gzip']:
+        body = gzip.compress(body, compresslevel=6)
+        response.headers['Content-Encoding'] = 'gzip'
+    response.set_data(body)
+    response.headers.update(headers)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def levels_response(result):
+    """
+    A result's values as a binary response - one uint8 level per value (value * number_of_levels),
+    gzip compressed when the client accepts it. The page reads it into a Uint8Array.
+
+    Headers:
+    X-Levels-Count: Number of values
+    X-Levels-Scale: Divide a level by it to get the value back
+    X-Levels-Resolution: Seconds between values
+    X-Sample-Rate: Sample rate of the analyzed track
+    """
+    scale = result['number_of_levels']
+    values = np.asarray(result['quantized_values'], dtype=np.float64)
+    return binary_response(np.clip(np.rint(values * scale), 0, 255),
+                           {'X-Levels-Count': str(len(values)),
+                            'X-Levels-Scale': str(scale),
+                            'X-Levels-Resolution': str(result.get('resolution', '')),
+                            'X-Sample-Rate': str(result['sample_rate'])})
+
+
+def window_response(key, result):
+    """
+    The [start, end) seconds window of a result at about `columns` buckets (query arguments),
+    read from its zoom pyramid. The body holds every bucket's maximum and then every bucket's
+    mean, one uint8 each (value * 255).
+
+    Headers:
+    X-Levels-Count: Number of buckets
+    X-Levels-Scale: Divide a byte by it to get the value back
+    X-Window-Start: Seconds where the first bucket starts
+    X-Window-Bucket: Seconds per bucket
+    """
+    try:
+        t0 = float(request.args.get('start', 0))
+        t1 = float(request.args.get('end', 'inf'))
+        columns = int(request.args.get('columns', 1000))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    window = pyramid(key, result).window(t0, t1, min(max(columns, 1), 10000))
+    scale = 255
+    body = np.clip(np.rint(np.concatenate([window['max'], window['mean']]) * scale), 0, 255)
+    return binary_response(body, {'X-Levels-Count': str(len(window['max'])),
+                                  'X-Levels-Scale': str(scale),
+                                  'X-Window-Start': repr(window['start']),
+                                  'X-Window-Bucket': repr(window['bucket_sec'])})
+
+
+def resolve_track(requested, default):
+    """
+    Track a job asks for - the command line track, or a file under AUDIO_DIR (<instrument>/<file>).
+    """
+    if not requested:
+        return default
+    path = safe_join(AUDIO_DIR, requested)
+    if path and os.path.isfile(path):
+        return path
+    return None
+
+
+def find_job(job_id):
+    """
+    A job by id. Jobs of other processes serving the app read queued until their result is cached.
+    """
+    job = JOBS.get(job_id)
+    if job is None:
+        cached = RESULT_CACHE.get(job_id)
+        if cached is not None:
+            job = JOBS.completed(job_id, cached)
+        else:
+            marker = RESULT_CACHE.pending(job_id)
+            if marker is not None:
+                job = pending_job(marker)
+    return job
+
+
+@views.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue an analysis. The JSON (or form) body may hold track and any of view_params' fields.
+
+    Returns 202 with the job's status, or the finished job at once when the result is cached.
+    """
+    args = current_app.config['VIEW_ARGS']
+    data = request.get_json(silent=True) or request.form.to_dict()
+    track = resolve_track(data.get('track'), args.track_path)
+    if track is None:
+        return jsonify(error=f"Unknown track {data.get('track')}"), 400
+    try:
+        params = view_params(args, data)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    try:
+        job = view_job(track, params)
+    except QueueFull as e:
+        return jsonify(error=str(e)), 429
+    if job.status == 'failed':
+        return jsonify(job.as_dict()), 500
+    return jsonify(job.as_dict()), 202
+
+
+@views.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = find_job(job_id)
+    if job is None:
+        return jsonify(error=f"Unknown job {job_id}"), 404
+    return jsonify(job.as_dict())
+
+
+@views.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """
+    The job's result when done, 202 with its status while it is queued or running.
+    """
+    job = find_job(job_id)
+    if job is None:
+        return jsonify(error=f"Unknown job {job_id}"), 404
+    if job.status == 'failed':
+        return jsonify(job.as_dict()), 500
+    if job.status != 'done':
+        return jsonify(job.as_dict()), 202
+    return jsonify(job.result)
+
+
+@views.route('/jobs/<job_id>/levels')
+def job_levels(job_id):
+    """
+    The job's result as binary levels (see levels_response), 202 with its status until it is done.
+    """
+    job = find_job(job_id)
+    if job is None:
+        return jsonify(error=f"Unknown job {job_id}"), 404
+    if job.status == 'failed':
+        return jsonify(job.as_dict()), 500
+    if job.status != 'done':
+        return jsonify(job.as_dict()), 202
+    return levels_response(job.result)
+
+
+@views.route('/jobs/<job_id>/window')
+def job_window(job_id):
+    """
+    A window of the job's result (see window_response), 202 with its status until it is done.
+    """
+    job = find_job(job_id)
+    if job is None:
+        return jsonify(error=f"Unknown job {job_id}"), 404
+    if job.status == 'failed':
+        return jsonify(job.as_dict()), 500
+    if job.status != 'done':
+        return jsonify(job.as_dict()), 202
+    return window_response(job.key, job.result)
+
+
+@views.route('/levels')
+def levels():
+    """
+    Binary levels of the command line track - query arguments may override view_params' fields.
+    Until the track is analyzed, 202 with the analysis job's status.
+    """
+    args = current_app.config['VIEW_ARGS']
+    src_track = args.track_path
+    try:
+        params = view_params(args, request.args.to_dict())
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    _, result, error = view_result(src_track, params)
+    if error is not None:
+        return error
+    return levels_response(result)
+
+
+@views.route('/window')
+def window():
+    """
+    A zoomed in window of the command line track: /window?start=<sec>&end=<sec>&columns=<pixels>,
+    other query arguments override view_params' fields like in /levels. 202 with the analysis job's
+    status until the track is analyzed.
+    """
+    args = current_app.config['VIEW_ARGS']
+    src_track = args.track_path
+    try:
+        params = view_params(args, request.args.to_dict())
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    key, result, error = view_result(src_track, params)
+    if error is not None:
+        return error
+    return window_response(key, result)
 
 
-    args = parser.parse_args()
+@views.route('/')
+def index():
+    args = current_app.config['VIEW_ARGS']
     src_track = args.track_path
-    scale = args.scale
-    # scales Relative, Normal, Percentile
-
-    instrument = args.instrument
-    levels = args.energy_levels
-    min_seg_length_sec = args.min_seg_length_sec
-    max_seg_length_sec = args.max_seg_length_sec
-
-    analyzer = SongAnalyzer(normalize_values=True, scale=scale, number_of_levels=levels,
-                            max_seg_length_sec=max_seg_length_sec, min_seg_length_sec=min_seg_length_sec)
-    quantized_values = analyzer.single_track_run(track=src_track, instrument=instrument,
-                                                 show_plot=False)
-
-    resolution = args.resolution # in sec
-    samples = int(resolution*analyzer.sample_rate)
-    quantized_values = quantized_values[::samples]
-    # Number of points in the slider and quantized list
-    length = len(quantized_values)
-    # Number of quantization steps
-    steps = analyzer.number_of_levels
-
-    # speed = 45 #1000/analyzer.sample_rate
-    speed = 1000/analyzer.sample_rate
-    # Playback speed in ms (time between updates)
-    # speed = int(request.args.get('speed', speedup))
+    # The page submits the analysis to /jobs and fetches its levels from the job once it is done,
+    # the textarea only shows them with ?debug=1
+    jobs_url = url_for('views.submit_job')
+    debug = request.args.get('debug', '') not in ('', '0', 'false')
+    # The page plays the analyzed track from a versioned URL, browsers keep it after the first visit
+    track_url = audio_url(src_track) if src_track and os.path.isfile(src_track) else None
 
     audio_files = [src_track]
 
@@ -334,7 +700,7 @@ def index():
         </div>
 
         <div class="info-panel">
-            <div class="info-card">
+            <div class="info-card" id="debugData"{% if not debug %} style="display: none;"{% endif %}>
                 <h3>📊 Data Input</h3>
                 <textarea id="quantizedData" class="sample-input" rows="4" 
                     placeholder="Enter quantized values (comma-separated, e.g., 0.1,0.5,0.8,0.3,0.9,0.2...)">0.1,0.5,0.8,0.3,0.9,0.2,0.7,0.4,0.6,0.8,0.3,0.5,0.9,0.1,0.7,0.4,0.6,0.2,0.8,0.5</textarea>
@@ -362,10 +728,18 @@ def index():
                 this.isPlaying = false;
                 this.animationId = null;
                 this.isDraggingProgress = false;
+                this.debug = {{ debug|tojson }};
+                this.resolution = 0;  // seconds per value of quantizedData
+                this.jobUrl = null;  // analysis job the levels and zoomed windows come from
+                this.view = null;  // zoomed in window: start, end, bucket, max, mean
+                this.viewRequest = 0;
+                this.layer = null;  // offscreen canvas with the grid and bars
+                this.layerKey = null;  // data, view and size the layer was drawn for
 
                 this.setupCanvas();
                 this.setupEventListeners();
                 this.setupDefaultData();
+                this.setupDefaultAudio();
                 this.updateDisplay();
             }
 
@@ -392,6 +766,17 @@ def index():
 
                 // Canvas click for seeking
                 this.canvas.addEventListener('click', (e) => this.seekToPosition(e));
+
+                // Wheel zooms around the pointer, double click shows the whole track again
+                this.canvas.addEventListener('wheel', (e) => {
+                    e.preventDefault();
+                    this.zoom(e);
+                }, { passive: false });
+                this.canvas.addEventListener('dblclick', () => {
+                    this.view = null;
+                    this.viewRequest++;
+                    this.drawGraph();
+                });
                 
                  // Progress bar interaction
                 this.setupProgressBarEvents();
@@ -464,30 +849,74 @@ def index():
                 this.updateDisplay();
             }
                       
-            setupDefaultData() {
-                // REPLACE THIS SECTION WITH YOUR CALCULATED LIST
-                const yourCalculatedList = {{ quantized_values }};
-                                
-                // Convert array to string for the text area
-                const defaultData = yourCalculatedList.join(',');
-                document.getElementById('quantizedData').value = defaultData;
-                this.updateQuantizedData();
+            async setupDefaultData() {
+                // The track is analyzed as a job: submit it, poll its status until it is done, then fetch
+                // its levels - one byte per value, level = value * scale
+                try {
+                    let job = await this.fetchJob({{ jobs_url|tojson }}, {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: '{}'
+                    });
+                    const jobUrl = {{ jobs_url|tojson }} + '/' + encodeURIComponent(job.id);
+                    while (job.status !== 'done') {
+                        await new Promise((resolve) => setTimeout(resolve, 1000));
+                        job = await this.fetchJob(jobUrl);
+                    }
+                    this.jobUrl = jobUrl;
+                    const response = await fetch(jobUrl + '/levels');
+                    if (!response.ok) throw new Error(`${response.status} ${response.statusText}`);
+                    const scale = parseFloat(response.headers.get('X-Levels-Scale')) || 1;
+                    this.resolution = parseFloat(response.headers.get('X-Levels-Resolution')) || 0;
+                    const levels = new Uint8Array(await response.arrayBuffer());
+                    const values = new Float32Array(levels.length);
+                    for (let i = 0; i < levels.length; i++) {
+                        values[i] = Math.min(1, levels[i] / scale);
+                    }
+                    this.setQuantizedData(values);
+                } catch (error) {
+                    this.showError('Levels loading error: ' + error.message);
+                }
+            }
+
+            async fetchJob(url, options) {
+                // A job's status, failed jobs and refused submits throw with the server's error
+                const response = await fetch(url, options);
+                const job = await response.json();
+                if (!response.ok || job.status === 'failed') {
+                    throw new Error(job.error || `${response.status} ${response.statusText}`);
+                }
+                return job;
             }
 
             // Method to programmatically set new data
             setQuantizedData(dataArray) {
-                if (Array.isArray(dataArray)) {
-                    document.getElementById('quantizedData').value = dataArray.join(',');
-                    this.updateQuantizedData();
+                if (Array.isArray(dataArray) || ArrayBuffer.isView(dataArray)) {
+                    this.quantizedData = dataArray;
+                    // Writing thousands of values to the textarea is only worth it in the debug view
+                    if (this.debug) {
+                        document.getElementById('quantizedData').value = Array.from(dataArray).join(',');
+                    }
+                    this.hideError();
+                    this.updateDisplay();
                 } else {
                     this.showError('Data must be an array of numbers');
                 }
             }
 
+            setupDefaultAudio() {
+                // The analyzed track, "Load Audio" can still replace it with a local file
+                const url = {{ track_url|tojson }};
+                if (url) this.setAudioSource(url);
+            }
+
             loadAudio(file) {
                 if (!file) return;
                 
-                const url = URL.createObjectURL(file);
+                this.setAudioSource(URL.createObjectURL(file));
+            }
+
+            setAudioSource(url) {
                 this.audio.src = url;
                 this.hideError();
                 
@@ -553,13 +982,67 @@ def index():
 
                 const rect = this.canvas.getBoundingClientRect();
                 const x = event.clientX - rect.left;
-                const progress = x / rect.width;
+                let progress = x / rect.width;
+                if (this.view) {
+                    const time = this.view.start + progress * (this.view.end - this.view.start);
+                    progress = Math.max(0, Math.min(1, time / this.duration()));
+                }
                 
                 this.audio.currentTime = progress * this.audio.duration;
                 this.currentSampleIndex = Math.floor(progress * this.quantizedData.length);
                 this.updateDisplay();
             }
 
+            duration() {
+                return this.audio.duration || this.quantizedData.length * this.resolution;
+            }
+
+            zoom(event) {
+                const total = this.duration();
+                if (!total) return;
+
+                const rect = this.canvas.getBoundingClientRect();
+                const start = this.view ? this.view.start : 0;
+                const end = this.view ? this.view.end : total;
+                const pointer = start + ((event.clientX - rect.left) / rect.width) * (end - start);
+                const span = (end - start) * (event.deltaY < 0 ? 0.5 : 2);
+                if (span >= total) {
+                    this.view = null;
+                    this.viewRequest++;
+                    this.drawGraph();
+                    return;
+                }
+                const newStart = Math.max(0, Math.min(total - span, pointer - (pointer - start) * span / (end - start)));
+                this.loadWindow(newStart, newStart + span);
+            }
+
+            async loadWindow(start, end) {
+                // Only the visible window, about one bucket per pixel, of the job the levels came from
+                if (!this.jobUrl) return;
+                const request = ++this.viewRequest;
+                const columns = Math.ceil(this.canvas.width / window.devicePixelRatio);
+                const params = new URLSearchParams({ start: start, end: end, columns: columns });
+                try {
+                    const response = await fetch(this.jobUrl + '/window?' + params);
+                    if (!response.ok) throw new Error(`${response.status} ${response.statusText}`);
+                    const count = parseInt(response.headers.get('X-Levels-Count'));
+                    const scale = parseFloat(response.headers.get('X-Levels-Scale')) || 1;
+                    const bytes = new Uint8Array(await response.arrayBuffer());
+                    if (request !== this.viewRequest) return;  // a newer zoom is on its way
+                    this.view = {
+                        start: start,
+                        end: end,
+                        first: parseFloat(response.headers.get('X-Window-Start')),
+                        bucket: parseFloat(response.headers.get('X-Window-Bucket')),
+                        max: Float32Array.from(bytes.subarray(0, count), (v) => v / scale),
+                        mean: Float32Array.from(bytes.subarray(count, 2 * count), (v) => v / scale)
+                    };
+                    this.drawGraph();
+                } catch (error) {
+                    this.showError('Zoom error: ' + error.message);
+                }
+            }
+
             onAudioLoaded() {
                 this.updateDisplay();
             }
@@ -605,74 +1088,145 @@ def index():
                 
                 if (this.quantizedData.length === 0) return;
 
-                // Draw grid
-                this.drawGrid(width, height);
-                
-                // Draw quantized data as bars
-                this.drawBars(width, height);
-                
-                // Draw cursor
+                // Grid and bars only change with the data, the zoom or the size - they are drawn
+                // once to an offscreen layer and copied, each frame only adds the highlight and cursor
+                const layer = this.getLayer();
+                this.ctx.drawImage(layer, 0, 0, width, height);
+
+                if (!this.view) {
+                    this.drawHighlight(width, height);
+                }
                 this.drawCursor(width, height);
             }
 
-            drawGrid(width, height) {
-                this.ctx.strokeStyle = 'rgba(255, 255, 255, 0.1)';
-                this.ctx.lineWidth = 1;
+            getLayer() {
+                const key = this.layerKey;
+                if (key && key.data === this.quantizedData && key.view === this.view &&
+                    key.width === this.canvas.width && key.height === this.canvas.height) {
+                    return this.layer;
+                }
+
+                if (!this.layer) this.layer = document.createElement('canvas');
+                this.layer.width = this.canvas.width;
+                this.layer.height = this.canvas.height;
+                const ctx = this.layer.getContext('2d');
+                // The layer is drawn in device pixels, bars are aggregated to one per pixel column
+                this.drawGrid(ctx, this.layer.width, this.layer.height);
+                const columns = this.view ? this.windowColumns(this.layer.width) : this.dataColumns(this.layer.width);
+                this.drawColumns(ctx, columns, this.layer.height);
+
+                this.layerKey = { data: this.quantizedData, view: this.view,
+                                  width: this.canvas.width, height: this.canvas.height };
+                return this.layer;
+            }
+
+            dataColumns(columns) {
+                // Maximum value per pixel column, a 1 pixel gap between bars wider than 2 pixels
+                const n = this.quantizedData.length;
+                const max = new Float32Array(columns).fill(-1);
+                if (n >= columns) {
+                    for (let i = 0; i < n; i++) {
+                        const c = Math.floor((i * columns) / n);
+                        max[c] = Math.max(max[c], this.quantizedData[i]);
+                    }
+                } else {
+                    for (let i = 0; i < n; i++) {
+                        const c0 = Math.floor((i * columns) / n);
+                        let c1 = Math.floor(((i + 1) * columns) / n);
+                        if (c1 - c0 > 2) c1--;
+                        max.fill(this.quantizedData[i], c0, c1);
+                    }
+                }
+                return { max: max, mean: null };
+            }
+
+            windowColumns(columns) {
+                // Maximum and mean of the window's buckets per pixel column
+                const view = this.view;
+                const span = view.end - view.start;
+                const max = new Float32Array(columns).fill(-1);
+                const mean = new Float32Array(columns).fill(-1);
+                for (let i = 0; i < view.max.length; i++) {
+                    const t = view.first + i * view.bucket - view.start;
+                    const c0 = Math.max(0, Math.floor((columns * t) / span));
+                    const c1 = Math.min(columns, Math.max(c0 + 1, Math.floor((columns * (t + view.bucket)) / span)));
+                    for (let c = c0; c < c1; c++) {
+                        max[c] = Math.max(max[c], view.max[i]);
+                        mean[c] = Math.max(mean[c], view.mean[i]);
+                    }
+                }
+                return { max: max, mean: mean };
+            }
+
+            drawColumns(ctx, columns, height) {
+                // One gradient for all bars, neighbouring columns of the same value in one rectangle
+                const gradient = ctx.createLinearGradient(0, height, 0, 0);
+                gradient.addColorStop(0, '#4ecdc4');
+                gradient.addColorStop(0.5, '#44a08d');
+                gradient.addColorStop(1, '#667eea');
+                this.fillColumns(ctx, columns.max, height, gradient);
+                if (columns.mean) this.fillColumns(ctx, columns.mean, height, '#44a08d');
+            }
+
+            fillColumns(ctx, values, height, style) {
+                ctx.fillStyle = style;
+                let start = 0;
+                for (let c = 1; c <= values.length; c++) {
+                    if (c < values.length && values[c] === values[start]) continue;
+                    if (values[start] > 0) {
+                        const barHeight = values[start] * height;
+                        ctx.fillRect(start, height - barHeight, c - start, barHeight);
+                    }
+                    start = c;
+                }
+            }
+
+            drawGrid(ctx, width, height) {
+                ctx.strokeStyle = 'rgba(255, 255, 255, 0.1)';
+                ctx.lineWidth = window.devicePixelRatio;
+                ctx.beginPath();
                 
                 // Horizontal lines
                 for (let i = 0; i <= 10; i++) {
                     const y = (height * i) / 10;
-                    this.ctx.beginPath();
-                    this.ctx.moveTo(0, y);
-                    this.ctx.lineTo(width, y);
-                    this.ctx.stroke();
+                    ctx.moveTo(0, y);
+                    ctx.lineTo(width, y);
                 }
                 
                 // Vertical lines
-                const step = Math.max(1, Math.floor(this.quantizedData.length / 20));
-                for (let i = 0; i < this.quantizedData.length; i += step) {
-                    const x = (width * i) / this.quantizedData.length;
-                    this.ctx.beginPath();
-                    this.ctx.moveTo(x, 0);
-                    this.ctx.lineTo(x, height);
-                    this.ctx.stroke();
+                const count = this.view ? 20 : this.quantizedData.length;
+                const step = this.view ? 1 : Math.max(1, Math.floor(count / 20));
+                for (let i = 0; i < count; i += step) {
+                    const x = (width * i) / count;
+                    ctx.moveTo(x, 0);
+                    ctx.lineTo(x, height);
                 }
+                ctx.stroke();
             }
 
-            drawBars(width, height) {
-                const barWidth = width / this.quantizedData.length;
-                
-                this.quantizedData.forEach((value, index) => {
-                    const x = (width * index) / this.quantizedData.length;
-                    const barHeight = value * height;
-                    const y = height - barHeight;
-                    
-                    // Create gradient for each bar
-                    const gradient = this.ctx.createLinearGradient(0, height, 0, 0);
-                    gradient.addColorStop(0, '#4ecdc4');
-                    gradient.addColorStop(0.5, '#44a08d');
-                    gradient.addColorStop(1, '#667eea');
-                    
-                    // Highlight current sample
-                    if (index === this.currentSampleIndex) {
-                        this.ctx.fillStyle = '#ff6b6b';
-                        this.ctx.shadowColor = '#ff6b6b';
-                        this.ctx.shadowBlur = 10;
-                    } else {
-                        this.ctx.fillStyle = gradient;
-                        this.ctx.shadowBlur = 0;
-                    }
-                    
-                    this.ctx.fillRect(x, y, barWidth - 1, barHeight);
-                });
+            drawHighlight(width, height) {
+                // Current sample, at least one device pixel wide
+                const n = this.quantizedData.length;
+                const value = this.quantizedData[this.currentSampleIndex] || 0;
+                const x = (width * this.currentSampleIndex) / n;
+                const barWidth = Math.max(1 / window.devicePixelRatio, width / n - (width / n > 2 ? 1 : 0));
                 
+                this.ctx.fillStyle = '#ff6b6b';
+                this.ctx.shadowColor = '#ff6b6b';
+                this.ctx.shadowBlur = 10;
+                this.ctx.fillRect(x, height - value * height, barWidth, value * height);
                 this.ctx.shadowBlur = 0;
             }
 
             drawCursor(width, height) {
                 if (this.quantizedData.length === 0) return;
                 
-                const x = (width * this.currentSampleIndex) / this.quantizedData.length;
+                let x = (width * this.currentSampleIndex) / this.quantizedData.length;
+                if (this.view) {
+                    const time = this.audio.currentTime || 0;
+                    if (time < this.view.start || time > this.view.end) return;
+                    x = (width * (time - this.view.start)) / (this.view.end - this.view.start);
+                }
                 
                 this.ctx.strokeStyle = '#ff6b6b';
                 this.ctx.lineWidth = 3;
@@ -743,18 +1297,63 @@ def index():
 </body>
 </html>
     ''',
-                                  length=length,
-                                  steps=steps,
-                                  speed=speed,
                                   audio_files=audio_files,
-                                  quantized_values=quantized_values)
-
-
-@app.route('/audio/<instrument>/<filename>')
+                                  track_url=track_url,
+                                  jobs_url=jobs_url,
+                                  debug=debug)
+
+
+def audio_url(track):
+    """
+    URL the page plays a track from, versioned by its content so it can be cached for good.
+
+    Files under AUDIO_DIR (<instrument>/<file>) are served by serve_audio, the command line
+    track from anywhere else by serve_track.
+    """
+    version = content_hash(track)[:16]
+    relative = os.path.relpath(os.path.abspath(track), AUDIO_DIR).split(os.sep)
+    if len(relative) == 2 and '..' not in relative:
+        return url_for('views.serve_audio', instrument=relative[0], filename=relative[1], v=version)
+    return url_for('views.serve_track', v=version)
+
+
+def send_audio(path):
+    """
+    Serve an audio file.
+
+    Range requests get just the asked bytes (206) and requests with a matching If-None-Match
+    get 304. The ETag is the file's content hash. URLs from audio_url (?v=<hash>) are cached
+    for AUDIO_MAX_AGE, others are revalidated on every use.
+    """
+    etag = content_hash(path)
+    versioned = request.args.get('v') == etag[:16]
+    response = send_file(path, conditional=True, etag=etag, max_age=AUDIO_MAX_AGE if versioned else 0)
+    if versioned:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+@views.route('/audio/<instrument>/<filename>')
 def serve_audio(instrument, filename):
     """Serve audio files from the audio directory"""
-    return send_from_directory(os.path.join(AUDIO_DIR, instrument), filename)
+    path = safe_join(AUDIO_DIR, instrument, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return send_audio(path)
+
+
+@views.route('/track')
+def serve_track():
+    """
+    Serve the command line track the page shows.
+    """
+    track = current_app.config['VIEW_ARGS'].track_path
+    if not track or not os.path.isfile(track):
+        abort(404)
+    return send_audio(track)
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app(parse_args()).run(debug=True)
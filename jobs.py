@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, key):
+        # The id is the key, so every process serving the app can tell which result a job is for
+        self.id = key
+        self.key = key
+        self.submitted = time.time()
+        self.finished = None
+        self.future = None
+        self.pool = None  # the executor the job was submitted to
+        self.result = None
+        self.error = None
+
+    @property
+    def status(self):
+        if self.finished is not None:
+            return 'failed' if self.error is not None else 'done'
+        if self.future is not None and self.future.running():
+            return 'running'
+        return 'queued'
+
+    def as_dict(self):
+        return {'id': self.id, 'status': self.status, 'submitted': self.submitted,
+                'finished': self.finished, 'error': self.error}
+
+
+class JobQueue:
+    """
+    Runs analysis jobs on a bounded pool and keeps their status and results.
+
+    At most max_workers jobs run at once and at most max_pending wait or run; submitting
+    more raises QueueFull. A job with the key of a queued, running or done job is not run
+    again, the submitter gets the existing job. The last keep_finished finished jobs are kept.
+    Jobs are identified by their keys.
+
+    A pool broken by a dead worker fails all the jobs it was running and is replaced on
+    the next submit.
+    """
+
+    def __init__(self, max_workers=2, max_pending=16, use_processes=True, keep_finished=256, on_done=None,
+                 on_failed=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.use_processes = use_processes
+        self.keep_finished = keep_finished
+        self.on_done = on_done  # called with (key, result) after a job succeeds
+        self.on_failed = on_failed  # called with (key, error) after a job fails
+        self.executor = None
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def pool(self):
+        # Created on the first job, so importing the app starts no workers
+        if self.executor is None:
+            executor = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self.executor = executor(max_workers=self.max_workers)
+        return self.executor
+
+    def submit(self, key, function, *args):
+        """
+        Queue function(*args) unless a job with the same key is queued, running or done.
+
+        Returns:
+        Job: The new or the existing job - failed already if no pool would take it
+        """
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job.status != 'failed':
+                return job
+            pending = sum(1 for job in self.jobs.values() if job.finished is None)
+            if pending >= self.max_pending:
+                raise QueueFull(f"{pending} jobs are waiting, try again later")
+            job = self.add(key)
+            try:
+                job.pool = self.pool()
+                try:
+                    job.future = job.pool.submit(function, *args)
+                except (BrokenExecutor, RuntimeError):
+                    # Broken by a dead worker or shut down - start over on a new pool once
+                    self.drop_pool(job.pool)
+                    job.pool = self.pool()
+                    job.future = job.pool.submit(function, *args)
+            except Exception as e:
+                # A job that never reached a pool must not stay queued forever
+                job.error = repr(e)
+                job.finished = time.time()
+        if job.future is None:
+            self.failed(job)
+        else:
+            job.future.add_done_callback(lambda future: self.finish(job, future))
+        return job
+
+    def completed(self, key, result):
+        """
+        Record a job whose result is already known (e.g. cached), without running anything.
+        """
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job.status != 'failed':
+                return job
+            job = self.add(key)
+            job.result = result
+            job.finished = time.time()
+        return job
+
+    def add(self, key):
+        job = Job(key)
+        # A failed job of the same key is replaced, the new one goes to the end
+        self.jobs.pop(key, None)
+        self.jobs[key] = job
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished is not None]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job_id]
+        return job
+
+    def drop_pool(self, executor):
+        # The next submit builds a new pool, unless another one replaced this one already
+        if executor is not None and self.executor is executor:
+            self.executor = None
+            executor.shutdown(wait=False)
+
+    def finish(self, job, future):
+        with self.lock:
+            if job.finished is not None:
+                return
+            broken = False
+            try:
+                job.result = future.result()
+            except BaseException as e:  # a cancelled future raises CancelledError, not an Exception
+                job.error = repr(e)
+                broken = isinstance(e, BrokenExecutor)
+            job.finished = time.time()
+            lost = []
+            if broken:
+                # Every job in flight on the broken pool is lost with it
+                self.drop_pool(job.pool)
+                lost = [other for other in self.jobs.values() if other.pool is job.pool and other.finished is None]
+                for other in lost:
+                    other.error = job.error
+                    other.finished = job.finished
+        if job.error is None:
+            if self.on_done is not None:
+                self.on_done(job.key, job.result)
+            return
+        for failed in [job] + lost:
+            self.failed(failed)
+
+    def failed(self, job):
+        if self.on_failed is not None:
+            self.on_failed(job.key, job.error)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
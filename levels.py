@@ -0,0 +1,207 @@
+import numpy as np
+
+
+class LevelTrack:
+    """
+    Quantized levels of a track, stored as runs instead of one value per sample.
+
+    Run i covers samples [starts[i], starts[i + 1]) (the last run ends at length) at
+    `rate` samples per second and holds the raw level levels[i] - the level index
+    quantize_form_list returns without normalization. Values handed out follow the
+    analyzer's normalize_values setting, so tolist() equals the old per-sample q list.
+    """
+
+    def __init__(self, starts, levels, length, rate, number_of_levels, normalize_values=False):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.levels = np.asarray(levels, dtype=np.int16)
+        self.length = int(length)
+        self.rate = rate
+        self.number_of_levels = number_of_levels
+        self.normalize_values = normalize_values
+
+    @classmethod
+    def from_runs(cls, runs, length, rate, number_of_levels, normalize_values=False):
+        """
+        Build a track from (start, level) pairs, merging neighbouring runs of the same level.
+        """
+        starts = []
+        levels = []
+        for start, level in runs:
+            if levels and levels[-1] == level:
+                continue
+            starts.append(start)
+            levels.append(level)
+        return cls(starts, levels, length, rate, number_of_levels, normalize_values)
+
+    def __len__(self):
+        return self.length
+
+    def values(self, levels):
+        """
+        Map raw levels to the values the analyzer reports (normalized if normalize_values).
+        """
+        if self.normalize_values:
+            return levels / self.number_of_levels
+        return levels
+
+    def ends(self):
+        if not len(self.starts):
+            return self.starts
+        return np.append(self.starts[1:], self.length)
+
+    def levels_at(self, samples):
+        """
+        Raw level at each sample index, 0 outside the track.
+        """
+        samples = np.asarray(samples)
+        runs = np.searchsorted(self.starts, samples, side='right') - 1
+        inside = (samples >= 0) & (samples < self.length) & (runs >= 0)
+        return np.where(inside, self.levels[np.clip(runs, 0, None)] if len(self.levels) else 0, 0)
+
+    def at(self, t):
+        """
+        Value at time t (seconds).
+        """
+        return self.values(self.levels_at(int(t * self.rate)).item())
+
+    def between(self, t0, t1):
+        """
+        Runs overlapping [t0, t1) seconds, clipped to it.
+
+        Returns:
+        list: (start sec, end sec, value) per run
+        """
+        lo = max(int(t0 * self.rate), 0)
+        hi = min(int(np.ceil(t1 * self.rate)), self.length)
+        ends = self.ends()
+        runs = []
+        for i in np.nonzero((self.starts < hi) & (ends > lo))[0]:
+            start = max(int(self.starts[i]), lo)
+            end = min(int(ends[i]), hi)
+            runs.append((start / self.rate, end / self.rate, self.values(int(self.levels[i]))))
+        return runs
+
+    def resample(self, resolution):
+        """
+        One value every `resolution` seconds, the same values as q[::int(resolution * rate)].
+
+        Returns:
+        np.ndarray: Values at 0, resolution, 2 * resolution, ...
+        """
+        step = max(1, int(resolution * self.rate))
+        return self.values(self.levels_at(np.arange(0, self.length, step)))
+
+    def to_dense(self, length=None, dtype=np.uint8):
+        """
+        Raw level of every sample, zero padded or cut to length - samples before the first run
+        are 0, like in levels_at.
+
+        Levels below 0 (values under the lowest reference) are stored as 0 in unsigned dtypes.
+        """
+        length = self.length if length is None else length
+        dense = np.zeros(length, dtype=dtype)
+        if not len(self.starts):
+            return dense
+        first = min(int(self.starts[0]), length)
+        ends = np.minimum(self.ends(), length)
+        run_lengths = np.maximum(ends - np.minimum(self.starts, length), 0)
+        levels = self.levels
+        if np.issubdtype(dtype, np.unsignedinteger):
+            levels = np.clip(levels, 0, None)
+        covered = int(run_lengths.sum())
+        dense[first:first + covered] = np.repeat(levels.astype(dtype), run_lengths)
+        return dense
+
+    def tolist(self):
+        """
+        Per-sample list of values - the q list of single_track_run.
+        """
+        return self.values(self.to_dense(dtype=np.int16).astype(np.int64)).tolist()
+
+    def as_dict(self):
+        """
+        JSON serializable form of the track, LevelTrack.from_dict builds it back.
+        """
+        return {'starts': self.starts.tolist(), 'levels': self.levels.tolist(), 'length': self.length,
+                'rate': self.rate, 'number_of_levels': self.number_of_levels,
+                'normalize_values': self.normalize_values}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class LevelPyramid:
+    """
+    Maximum and mean value of a LevelTrack per bucket, at power-of-two zoom levels.
+
+    Zoom level 0 has buckets of base_samples samples, every next level buckets twice as long,
+    up to a single bucket for the whole track. A window of the track at some number of columns
+    is read from the coarsest level that still has at least one bucket per column, so a view
+    costs about `columns` values however long the track is.
+    """
+
+    def __init__(self, track, base_resolution=0.01):
+        self.rate = track.rate
+        self.length = track.length
+        self.base_samples = max(1, int(base_resolution * track.rate))
+        maximums, means = self.base_buckets(track)
+        counts = np.diff(np.append(np.arange(0, self.length, self.base_samples), self.length)).astype(np.float64)
+        self.maximums = [track.values(maximums).astype(np.float32)]
+        self.means = [track.values(means).astype(np.float32)]
+        while len(counts) > 1:
+            # Merge neighbouring buckets, an odd last bucket stays on its own
+            pairs = len(counts) // 2
+            odd = len(counts) % 2
+            top = self.maximums[-1]
+            merged_max = np.maximum(top[:2 * pairs:2], top[1:2 * pairs:2])
+            sums = self.means[-1] * counts
+            merged_counts = counts[:2 * pairs:2] + counts[1:2 * pairs:2]
+            merged_sums = sums[:2 * pairs:2] + sums[1:2 * pairs:2]
+            if odd:
+                merged_max = np.append(merged_max, top[-1])
+                merged_counts = np.append(merged_counts, counts[-1])
+                merged_sums = np.append(merged_sums, sums[-1])
+            self.maximums.append(merged_max)
+            self.means.append((merged_sums / merged_counts).astype(np.float32))
+            counts = merged_counts
+
+    def base_buckets(self, track):
+        """
+        Exact maximum and mean raw level of every base bucket, computed from the runs.
+
+        Returns:
+        tuple: (maximums, means) - one per base bucket
+        """
+        edges = np.append(np.arange(0, self.length, self.base_samples), self.length)
+        if self.length == 0:
+            return np.zeros(0), np.zeros(0)
+        # Level 0 before the first run, like levels_at
+        levels = np.append(0, track.levels).astype(np.float64)
+        starts = np.minimum(track.starts, self.length)
+        run_edges = np.append(starts, self.length)
+        integral = np.append(0, np.cumsum(track.levels * np.diff(run_edges)))
+        means = np.diff(np.interp(edges, run_edges, integral)) / np.diff(edges)
+
+        first = np.searchsorted(track.starts, edges[:-1], side='right')
+        last = np.searchsorted(track.starts, edges[1:] - 1, side='right')
+        # reduceat covers runs first[i] .. first[i + 1] - 1, the run holding the bucket's last sample is added
+        maximums = np.maximum(np.maximum.reduceat(levels, first), levels[last])
+        return maximums, means
+
+    def window(self, t0, t1, columns):
+        """
+        Buckets covering [t0, t1) seconds, at least one per column where the track allows it.
+
+        Returns:
+        dict: start (sec of the first bucket), bucket_sec, max and mean - one value per bucket
+        """
+        t0 = max(0.0, t0)
+        t1 = min(max(t1, t0), self.length / self.rate)
+        wanted = (t1 - t0) * self.rate / max(1, columns)
+        zoom = int(np.clip(np.floor(np.log2(max(wanted, 1) / self.base_samples)), 0, len(self.means) - 1))
+        bucket = self.base_samples * 2 ** zoom
+        first = int(t0 * self.rate // bucket)
+        last = max(first, int(np.ceil(t1 * self.rate / bucket)))
+        return {'start': first * bucket / self.rate, 'bucket_sec': bucket / self.rate,
+                'max': self.maximums[zoom][first:last], 'mean': self.means[zoom][first:last]}
@@ -0,0 +1,187 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# File plots are drawn on matplotlib.figure.Figure directly, never through pyplot, so no
+# GUI backend or display is needed and figures don't pile up in pyplot's global state.
+# matplotlib and pandas are imported inside the functions, only when something is plotted.
+
+
+def decimate_minmax(values, columns):
+    """
+    Reduce values to the min and max of each of `columns` equal buckets.
+
+    Drawn as a filled band, the result looks like the full signal at `columns` pixels wide.
+
+    Returns:
+    tuple: (bucket start indices, bucket minimums, bucket maximums)
+    """
+    values = np.asarray(values)
+    columns = max(1, min(columns, len(values)))
+    starts = np.linspace(0, len(values), columns + 1).astype(np.int64)[:-1]
+    if not len(values):
+        return starts, values, values
+    return starts, np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)
+
+
+def level_steps(levels, length=None):
+    """
+    Corners of a LevelTrack's step line, one point per run.
+
+    Returns:
+    tuple: (times in seconds, values) for a step plot with where='post'
+    """
+    length = levels.length if length is None else length
+    starts = np.minimum(levels.starts, length)
+    values = levels.values(levels.levels.astype(np.int64))
+    times = np.append(starts, length) / levels.rate
+    return times, np.append(values, values[-1] if len(values) else 0)
+
+
+def track_job(path, y_power, levels, instrument, number_of_levels, width_px=1600, height_px=400):
+    """
+    Everything render needs to plot a track's quantized signal over its power.
+
+    The envelope is decimated here, so jobs are small enough to send to worker processes.
+    """
+    y_norm = y_power / (((number_of_levels + 1) / 2) * y_power.mean())
+    starts, low, high = decimate_minmax(y_norm, width_px)
+    return {'path': path, 'width_px': width_px, 'height_px': height_px,
+            'title': f"{instrument} - Quantize Signal Vs Original",
+            'axes': [{'envelope': (starts / levels.rate, low, high),
+                      'steps': level_steps(levels, len(y_power)), 'label': 'Power'}]}
+
+
+def tracks_job(path, quantize_tracks, instruments, width_px=600, height_px=1500):
+    """
+    Job plotting the quantized levels of several tracks one under the other (the run port plot).
+    """
+    length = max(len(quantize_tracks[instrument]) for instrument in instruments)
+    return {'path': path, 'width_px': width_px, 'height_px': height_px, 'title': None,
+            'axes': [{'steps': level_steps(quantize_tracks[instrument], length), 'label': instrument}
+                     for instrument in instruments]}
+
+
+def render(job, dpi=100):
+    """
+    Draw a job to its path - the format (png, svg, pdf) follows the file extension.
+
+    Returns:
+    str: The written path
+    """
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(job['width_px'] / dpi, job['height_px'] / dpi), dpi=dpi)
+    axes = figure.subplots(nrows=len(job['axes']), ncols=1, squeeze=False)[:, 0]
+    for ax, plot in zip(axes, job['axes']):
+        if 'envelope' in plot:
+            times, low, high = plot['envelope']
+            ax.fill_between(times, low, high, step='post', linewidth=0, alpha=0.5, label='OrgSignal')
+        times, values = plot['steps']
+        ax.step(times, values, where='post', color='tab:orange', label='Quantize Signal')
+        ax.set_ylabel(plot['label'])
+        ax.grid(True)
+    if job['title']:
+        axes[0].set_title(job['title'])
+        axes[0].legend(loc='upper right')
+    axes[-1].set_xlabel('Time (sec)')
+    figure.tight_layout()
+
+    directory = os.path.dirname(job['path'])
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    figure.savefig(job['path'])
+    return job['path']
+
+
+def render_batch(jobs, workers=None):
+    """
+    Render jobs, in a process pool when workers > 1.
+
+    Returns:
+    list: Written paths, in the order of jobs
+    """
+    if workers and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            return list(pool.map(render, jobs))
+    return [render(job) for job in jobs]
+
+
+def show_array(array, title="Plot of Array", x_ticks=None, log_scale=False):
+    import matplotlib.pyplot as plt
+
+    if not isinstance(array, np.ndarray) and not isinstance(array, list):
+        raise TypeError("Input must be a numpy array or list.")
+
+    plt.plot(array)
+    plt.title(title)
+    plt.xlabel("Time")
+    plt.ylabel("Value dB")
+    if log_scale:
+        plt.yscale("log")
+    plt.grid(True)
+    if x_ticks:
+        positions, labels = x_ticks
+        plt.xticks(positions, labels)
+    plt.show()
+
+
+def show_track(y_power, levels, instrument, number_of_levels, ticks):
+    """
+    Interactive plot of a track's quantized signal over its normalized power.
+    """
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    # Match q length to y_power by zero padding
+    q = levels.values(levels.to_dense(length=y_power.shape[0], dtype=np.int16))
+
+    y_norm = y_power / (((number_of_levels + 1) / 2) * y_power.mean())
+    data = {
+        'x': range(y_power.shape[0]),
+        'Signal': y_norm,
+        'Quantize Signal': q
+    }
+    df = pd.DataFrame(data)
+    df.plot(x='x', y='Signal', label='OrgSignal ', legend=True)
+    df.plot(x='x', y='Quantize Signal', label='Quantize Signal', legend=True,
+            ax=plt.gca())  # Use the same axes
+    positions, labels = ticks
+    plt.xticks(positions, labels)
+    plt.title(f"{instrument} - Quantize Signal Vs Original")
+    plt.xlabel("Samples")
+    plt.ylabel("Power")
+    plt.grid(True)
+    plt.show()
+
+
+def show_quantized_tracks(quantize_tracks, instruments, ticks):
+    """
+    Interactive plot of the quantized levels of several tracks one under the other.
+    """
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    number_of_samples = max(len(quantize_tracks[i]) for i in instruments)
+
+    # Plotting results, tracks padded with zeros
+    data = {'x': range(number_of_samples)}
+    for instrument in instruments:
+        levels = quantize_tracks[instrument]
+        data[instrument] = levels.values(levels.to_dense(length=number_of_samples, dtype=np.int16))
+
+    df = pd.DataFrame(data)
+    fig, axes = plt.subplots(nrows=len(instruments), ncols=1, figsize=(6, 15))
+
+    positions, labels = ticks
+
+    for i, ax in enumerate(axes):
+        df.plot(x='x', y=instruments[i], ax=ax, title=f'{instruments[i]}')
+        ax.set_xticks(positions)
+        ax.set_xticklabels(labels)
+
+    plt.tight_layout()
+    plt.ylabel('Power')
+    plt.xlabel('Time')
+    plt.show()
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+def quantize_array(values, ref_list, number_of_levels, normalize_values=False):
+    """
+    Quantize a whole array of values against a sorted list of reference levels.
+
+    Gives the same result as calling quantize_form_list on every element: a value
+    gets the index of the first reference it is smaller than, minus one, and values
+    that are not below any reference get number_of_levels.
+
+    Parameters:
+    values (array-like): Values to quantize (a scalar is accepted as well)
+    ref_list (list): Sorted reference levels
+    number_of_levels (int): Level returned for values above all references
+    normalize_values (bool): Return levels divided by number_of_levels
+
+    Returns:
+    np.ndarray: Level of every value
+    """
+    refs = np.asarray(ref_list)
+    levels = np.searchsorted(refs, values, side='right') - 1
+    levels = np.where(levels == len(refs) - 1, number_of_levels, levels)
+    if normalize_values:
+        return levels / number_of_levels
+    return levels
+
+
+def threshold_index(length, below):
+    """
+    Index bin_search_index returns for a sorted array of `length` values of which `below`
+    are smaller than the reference, without needing the sorted array.
+    """
+    right = length
+    left = 0
+    mid = (right + left) // 2
+    while right > left:
+        mid = (right + left) // 2
+        if mid < below:
+            left = mid + 1
+        else:
+            right = mid - 1
+    return mid
+
+
+def relative_reference_levels(values, number_of_levels, sensitivity_power=0.001):
+    """
+    Reference levels of the Relative scale.
+
+    The levels split the values above sensitivity_power into number_of_levels equal
+    groups. Only the order statistics at the level boundaries are needed, so they are
+    selected with np.partition instead of sorting the whole track.
+
+    Parameters:
+    values (np.ndarray): Values the levels are computed from (e.g. a power envelope)
+    number_of_levels (int): Number of levels
+    sensitivity_power (float): Values below it are ignored as silence
+
+    Returns:
+    list: Sorted reference levels starting with 0
+    """
+    values = np.asarray(values)
+    index = threshold_index(len(values), np.count_nonzero(values < sensitivity_power))
+    step = (len(values) - index) // number_of_levels
+    kth = [index + (i * step) for i in range(1, number_of_levels)]
+    if not kth:
+        return [0]
+    selected = np.partition(values, kth)
+    return [0] + [selected[k] for k in kth]
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from audio_cache import content_hash
+
+# Keys made by ResultCache.key - other keys (e.g. from a URL) are never looked up on disk
+KEY_PATTERN = re.compile(r'[0-9a-f]{64}-[0-9a-f]{16}')
+
+# Pending markers older than this are left by a process that died before finishing the result
+PENDING_MAX_AGE_SEC = 3600
+
+
+class ResultCache:
+    """
+    Analysis results keyed by track content and analysis parameters.
+
+    The newest max_entries results are kept in memory (least recently used are dropped
+    first). With cache_dir set every result is also written there as JSON, so results
+    survive a restart and are shared by processes using the same folder. Results must
+    be JSON serializable. The folder is kept under max_bytes by removing the least recently
+    used results. A result being computed can be marked pending there too (mark_pending),
+    so the other processes know it is on its way.
+
+    version is part of every key: when the results' format changes, a new version keeps
+    results of the old format from being read.
+    """
+
+    def __init__(self, max_entries=32, cache_dir=None, version=1, max_bytes=256 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = version
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, track, params):
+        """
+        Cache key of a track analyzed with params (a dict of analysis settings).
+        """
+        params_hash = hashlib.sha256(json.dumps([self.version, params], sort_keys=True).encode()).hexdigest()[:16]
+        return f"{content_hash(track)}-{params_hash}"
+
+    def path(self, key, extension='.json'):
+        return os.path.join(self.cache_dir, key + extension)
+
+    def get(self, key):
+        """
+        Cached result, None if there is none.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        if self.cache_dir and KEY_PATTERN.fullmatch(key) and os.path.exists(self.path(key)):
+            try:
+                # Touch the entry so eviction sees it as recently used
+                os.utime(self.path(key))
+                with open(self.path(key)) as f:
+                    result = json.load(f)
+            except FileNotFoundError:
+                # Evicted by another process meanwhile
+                return None
+            self.remember(key, result)
+            return result
+        return None
+
+    def put(self, key, result):
+        self.remember(key, result)
+        if self.cache_dir:
+            self.write(self.path(key), result)
+            self.clear_pending(key)
+            self.evict(keep=self.path(key))
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used results from cache_dir until it fits in max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                result_path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(result_path)
+                except OSError:
+                    # Removed by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, result_path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, result_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if result_path == keep:
+                continue
+            try:
+                os.remove(result_path)
+            except OSError:
+                continue
+            total -= size
+
+    def mark_pending(self, key):
+        """
+        Record in cache_dir that the result of key is being computed.
+        """
+        if self.cache_dir and KEY_PATTERN.fullmatch(key):
+            self.write(self.path(key, '.pending'), {'key': key, 'submitted': time.time()})
+
+    def pending(self, key, max_age=PENDING_MAX_AGE_SEC):
+        """
+        Pending marker of key, None if there is none or it is older than max_age seconds.
+
+        Returns:
+        dict: {'key', 'submitted'} - submitted is a time.time() timestamp
+        """
+        if not (self.cache_dir and KEY_PATTERN.fullmatch(key)):
+            return None
+        try:
+            with open(self.path(key, '.pending')) as f:
+                marker = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - marker['submitted'] > max_age:
+            return None
+        return marker
+
+    def clear_pending(self, key):
+        if self.cache_dir and KEY_PATTERN.fullmatch(key):
+            try:
+                os.remove(self.path(key, '.pending'))
+            except FileNotFoundError:
+                pass
+
+    def write(self, path, data):
+        # Write under a temporary name first so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def remember(self, key, result):
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
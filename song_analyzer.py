@@ -1,14 +1,25 @@
 import os
-import librosa
+import json
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 import math
+from concurrent.futures import ProcessPoolExecutor
+
+from audio_cache import content_hash
+from envelope import EnvelopeIndex, WindowMedians
+from levels import LevelTrack
+import plotting
+from quantizer import quantize_array, relative_reference_levels
+from stats import AnalysisStats
+from stem_manager import StemManager
+from streaming import StreamingSegmenter, stream_blocks, stream_reference_levels
+from window_reducers import reduce_windows
 
 
 class SongAnalyzer:
     def     __init__(self, min_seg_length_sec=5, max_seg_length_sec=40, min_width_sec=1,
-                 number_of_levels=5, sensitivity_power=0.001, scale=None,normalize_values=False):
+                 number_of_levels=5, sensitivity_power=0.001, scale=None,normalize_values=False,
+                 median_mode='exact', median_hop_sec=None, audio_cache=None, envelope_rate=None,
+                 on_stats=None, tables_path=None, stem_manager=None, plot_dir=None, plot_format='png'):
         self.min_seg_length_sec = min_seg_length_sec
         self.max_seg_length_sec = max_seg_length_sec
         self.min_width_sec = min_width_sec
@@ -29,137 +40,326 @@ class SongAnalyzer:
                                  'other': [0, 0.0012159692, 0.0014660307, 0.0017518019, 0.0020739958, 0.0024313275, 0.0028228816, 0.0032472152, 0.0037045958, 0.0041945763, 0.0047165235, 0.0052709244, 0.0058576637, 0.006478266, 0.007131314, 0.007820956, 0.008546062, 0.009294467, 0.010075849, 0.010915624, 0.011801757, 0.012735426, 0.013714738, 0.014744898, 0.015827501, 0.01696292, 0.018159458, 0.019416416, 0.020735618, 0.022122527, 0.023577422, 0.025111604, 0.026720988, 0.02841707, 0.030204238, 0.032086622, 0.03407658, 0.03617948, 0.038408276, 0.040762484, 0.043262158, 0.04591789, 0.048760142, 0.051806416, 0.055079475, 0.05860917, 0.062425993, 0.06657897, 0.07113121, 0.07614411, 0.08170158, 0.08793407, 0.09499398, 0.10310994, 0.11261358, 0.12400356, 0.1381113, 0.15654816, 0.18288808, 0.22793823],
                                  'main': [0, 0.0015581478, 0.0021928577, 0.0028938802, 0.003654058, 0.004469499, 0.0053401613, 0.0062646656, 0.0072414503, 0.008275367, 0.009369561, 0.010528434, 0.011754644, 0.013045382, 0.014407493, 0.015844528, 0.017361723, 0.01896102, 0.02064693, 0.02241943, 0.024284257, 0.02624285, 0.028305732, 0.03047591, 0.0327631, 0.035173804, 0.03771267, 0.04038921, 0.043206654, 0.046189725, 0.04933335, 0.05266592, 0.056192547, 0.059925035, 0.06389488, 0.06811552, 0.072609946, 0.077397704, 0.0825332, 0.08803107, 0.09392966, 0.10028723, 0.10715951, 0.11459597, 0.12266302, 0.13141489, 0.14096773, 0.1513802, 0.16277456, 0.17529559, 0.1890661, 0.20433073, 0.22137704, 0.24073666, 0.26311758, 0.28957248, 0.3222283, 0.36454862, 0.42488298, 0.52815664]
                                  }
+        if tables_path:
+            self.load_tables(tables_path)
         self.sample_rate = None
+        self.levels_rate = None  # rate of the analyzed envelope and of q - sample_rate unless envelope_rate is set
+        self.envelope_rate = envelope_rate  # Hz, analyze a frame envelope instead of every sample
         self.ref_values = None
+        self.ref_cache = {}
         self.normalize_values = normalize_values
+        self.median_mode = median_mode  # exact, approximate
+        self.median_hop_sec = median_hop_sec
+        self.audio_cache = audio_cache  # AudioCache of decoded tracks, None decodes on every load
+        self.plot_dir = plot_dir  # write plots as files here instead of opening windows
+        self.plot_format = plot_format  # png, svg
+        self.stem_manager = stem_manager or StemManager()  # separated stems of the analyzed songs
+        self.stats = AnalysisStats()  # stages and counters of the last analyzed track
+        self.on_stats = on_stats  # called with (instrument, stats dict) after every analyzed track
+
+    def load_tables(self, path):
+        """
+        Use the scale tables of a calibrate_scales.py tables file instead of the ones above.
+
+        Instruments missing from the file keep their built-in tables.
+        """
+        with open(path) as f:
+            tables = json.load(f)
+        self.percentile_scale.update(tables.get('percentile_scale', {}))
+        self.standard_values.update(tables.get('standard_values', {}))
+
+    def __getstate__(self):
+        # The stats hook stays in the parent process, it may not be picklable
+        state = self.__dict__.copy()
+        state['on_stats'] = None
+        return state
+
+    def report_stats(self, instrument, stats):
+        stats = stats.as_dict()
+        if self.on_stats is not None:
+            self.on_stats(instrument, stats)
+        return stats
+
+    def run(self, song_name, show_sub_plots=False, separate=False, show_port=True, workers=None,
+            return_stats=False):
+        """
+        Analyze the full song - every separated stem and the main track.
+
+        workers > 1 analyzes the stems in a process pool (call it under
+        if __name__ == '__main__' on platforms that spawn workers). Plotting
+        always happens here, in the parent process, after all stems are done.
+        With plot_dir set the plots are written as files, rendered by `workers` processes.
 
-    def run(self, song_name, show_sub_plots=False, separate=False, show_port=True):
-        command = f"demucs --mp3 {song_name}.mp3"
-        if separate:
-            # Execute the command
-            os.system(command)
+        With return_stats the stats of every instrument (see AnalysisStats) are returned
+        as well, with the song's separation, analysis and port plot under 'song' and the sum
+        of all instruments' stats under 'total' (with workers its times add up the time of
+        every worker, so they may exceed the song's analysis time).
+        """
+        song_stats = AnalysisStats()
         instruments = ['bass', 'drums', 'vocals', 'other', 'main']
-        tracks = [f"separated/htdemucs/{song_name}/{inst}.mp3" if inst != "main" else f"{song_name}.mp3"
-                  for inst in instruments]
+        # Separates the song unless stems of its current content exist
+        with song_stats.stage('separate'):
+            paths = self.stem_manager.stem_paths(f"{song_name}.mp3", separate=separate)
+        tracks = [paths[inst] for inst in instruments]
+
+        stems = [(self, track, instruments[i], show_sub_plots) for i, track in enumerate(tracks)]
+        with song_stats.stage('analysis'):
+            if workers and workers > 1:
+                with ProcessPoolExecutor(max_workers=min(workers, len(stems))) as pool:
+                    results = list(pool.map(analyze_stem, *zip(*stems)))
+            else:
+                results = [analyze_stem(*stem) for stem in stems]
 
         quantize_tracks = {}
         instruments_segments = {}
-        for i, track in enumerate(tracks):
-            y, self.sample_rate = librosa.load(track)
-            y_power = np.abs(y)
-
-            min_seg_length = self.sample_rate * self.min_seg_length_sec
-            max_seg_length = self.sample_rate * self.max_seg_length_sec
-            min_width = self.sample_rate * self.min_width_sec
-
-            print(f"Processing {instruments[i]} - shape: {y.shape}, sample rate: {self.sample_rate}")
-            print(f"Minimum  value : {y_power.min()}")
-            print(f"Maximum  value : {y_power.max()}")
-
-            self.ref_values = self.get_quantizer_vals(values=y_power, instrument=instruments[i])
-
-            # Process segments and quantization
-            segments = {}
-            q = []
-
-            s = self.remove_opening_silence(powers=y_power,instrument=instruments[i])
-            e = s + min_seg_length
-            q.extend([0] * s)
-
-            while e < y_power.shape[0]:
-                left, right = min_seg_length + s, max_seg_length + s
-                section_power = self.quantize_form_list(y_power[s:s + min_seg_length].mean(), ref_list=self.ref_values)
-                while left <= right:
-                    mid = (left + right) // 2
-                    if (self.quantize_form_list(np.median(y_power[mid - (min_width // 2):mid + (min_width // 2)]),
-                                           ref_list=self.ref_values)
-                        == section_power) and (
-                    self.check_constant_range(values=y_power[s:mid + (min_width // 2)], val=section_power, step=min_width,
-                                         ref=self.ref_values)):
-                        left = mid + 1
+        instruments_stats = {}
+        total_stats = AnalysisStats()
+        plot_jobs = []
+        for i, (segments, levels, y_power, sample_rate, levels_rate, ref_values, stats) in enumerate(results):
+            # Keep the analyzer state a sequential run leaves behind
+            self.sample_rate = sample_rate
+            self.levels_rate = levels_rate
+            self.ref_values = ref_values
+            self.ref_cache[self.ref_cache_key(tracks[i], instruments[i])] = ref_values
+
+            quantize_tracks[instruments[i]] = levels
+
+            instruments_segments[instruments[i]] = segments
+            if show_sub_plots:
+                with stats.stage('plot'):
+                    if self.plot_dir:
+                        plot_jobs.append(plotting.track_job(self.plot_path(song_name, instruments[i]), y_power,
+                                                            levels, instruments[i], self.number_of_levels))
                     else:
-                        right = mid - 1
+                        self.plot_track(y_power, levels, instruments[i])
+            instruments_stats[instruments[i]] = self.report_stats(instruments[i], stats)
+            total_stats.merge(stats)
+
+        if show_port or plot_jobs:
+            with song_stats.stage('plot'):
+                if show_port and self.plot_dir:
+                    plot_jobs.append(plotting.tracks_job(self.plot_path(song_name, 'port'), quantize_tracks,
+                                                         instruments))
+                elif show_port:
+                    self.plot_quantized_tracks(quantize_tracks,  instruments)
+                plotting.render_batch(plot_jobs, workers=workers)
+
+        instruments_stats['song'] = self.report_stats('song', song_stats)
+        instruments_stats['total'] = self.report_stats('total', total_stats)
+        if return_stats:
+            return instruments_segments, instruments_stats
+        return instruments_segments
 
-                mid = (s + e) // 2
-                e = mid
+    def single_track_run(self, track, instrument, show_plot=True, segments_print=False, as_levels=False,
+                         return_stats=False):
+        """
+        Analyze a single track.
 
-                power = self.quantize_form_list(value=y_power[s:e].mean(),ref_list=self.ref_values)
-                q.extend([power] * (e - s))
-                segments[len(segments)] = {"start": self.get_sec_from_sr(s),
-                                           "end": self.get_sec_from_sr(e),
-                                           "power": power}
-                s = e
-                e = e + min_seg_length
+        Parameters:
+        track (str): Audio file
+        instrument (str): Track's instrument
+        show_plot (bool): Plot the quantized signal over the original (to a file in plot_dir if set)
+        segments_print (bool): Print the runs of constant power
+        as_levels (bool): Return the LevelTrack instead of a per-sample list
+        return_stats (bool): Return the track's stats dict as well (see AnalysisStats)
 
-            quantize_tracks[instruments[i]] = q
+        Returns:
+        list or LevelTrack: Quantized value of every levels_rate sample, (result, stats) with return_stats
+        """
+        y_power, segments, levels = self.analyze_track(track=track, instrument=instrument)
 
-            instruments_segments[instruments[i]] = segments
-            if show_sub_plots:
-                # Match q length to y_power by zero padding
-                if len(q) > y_power.shape[0]:
-                    q = q[:-(len(q) - y_power.shape[0])]
-                elif len(q) < y_power.shape[0]:
-                    q.extend([0] * (y_power.shape[0] - len(q)))
+        if segments_print:
+            segments_cont = {}
+            ends = levels.ends()
+            # Every run but the last one, which the per-sample walk never closed
+            for start, end, level in zip(levels.starts[:-1], ends[:-1], levels.levels[:-1]):
+                segments_cont[len(segments_cont)] = {"start": self.get_sec_from_sr(int(start)),
+                                                     "end": self.get_sec_from_sr(int(end) - 1),
+                                                     "power": levels.values(int(level))}
+
+            print(segments_cont)
+
+
+        if show_plot:
+            with self.stats.stage('plot'):
+                if self.plot_dir:
+                    plotting.render(plotting.track_job(self.plot_path(track, instrument), y_power, levels,
+                                                       instrument, self.number_of_levels))
                 else:
-                    pass
-
-                y_norm = y_power / (((self.number_of_levels + 1) / 2) * y_power.mean())
-                data = {
-                    'x': range(y_power.shape[0]),
-                    'Signal': y_norm,
-                    'Quantize Signal': q
-                }
-                df = pd.DataFrame(data)
-                df.plot(x='x', y='Signal', label='OrgSignal ', legend=True)
-                df.plot(x='x', y='Quantize Signal', label='Quantize Signal', legend=True,
-                        ax=plt.gca())  # Use the same axes
-                ticks = self.get_ticks(length=y_power.shape[0])
-                positions, labels = ticks
-                plt.xticks(positions, labels)
-                plt.title(f"{instruments[i]} - Quantize Signal Vs Original")
-                plt.xlabel("Samples")
-                plt.ylabel("Power")
-                plt.grid(True)
-                plt.show()
-
-        if show_port:
-            self.plot_quantized_tracks(quantize_tracks,  instruments)
+                    self.plot_track(y_power, levels, instrument)
 
-        return instruments_segments
+        stats = self.report_stats(instrument, self.stats)
+        result = levels if as_levels else levels.tolist()
+        if return_stats:
+            return result, stats
+        return result
 
-    def single_track_run(self, track, instrument, show_plot=True, segments_print=False):
-        y, self.sample_rate = librosa.load(track)
-        y_power = np.abs(y)
+    def stream_track_run(self, track, instrument, block_sec=30):
+        """
+        Analyze a track block by block, for recordings too long to load into memory.
+
+        Peak memory is bounded by block_sec and min_width_sec whatever the length of the
+        track. The Relative scale reads the track twice more to select its reference
+        levels exactly (see stream_reference_levels).
+
+        Returns:
+        dict: Segments, the same as segment_powers returns for the loaded track
+        """
+        self.sample_rate = 22050  # librosa.load's default rate
+        self.levels_rate = self.sample_rate
+        self.stats = AnalysisStats()
+
+        def power_blocks():
+            for block in stream_blocks(track, sr=self.sample_rate, block_sec=block_sec):
+                yield np.abs(block)
+
+        key = self.ref_cache_key(track, instrument)
+        with self.stats.stage('reference_levels'):
+            if self.scale not in ('Normal', 'Percentile') and key not in self.ref_cache:
+                self.ref_cache[key] = stream_reference_levels(power_blocks, number_of_levels=self.number_of_levels,
+                                                              sensitivity_power=self.sensitivity_power)
+            self.ref_values = self.get_quantizer_vals(values=None, instrument=instrument, track=track)
+
+        print(f"Streaming {instrument} - sample rate: {self.sample_rate}")
+        segmenter = StreamingSegmenter(analyzer=self, ref_list=self.ref_values)
+        with self.stats.stage('segmentation'):
+            for powers in power_blocks():
+                segmenter.push(powers)
+            segmenter.finish()
+        self.stats.count('segments', len(segmenter.segments))
+        self.report_stats(instrument, self.stats)
+        return segmenter.segments
+
+    def analyze_track(self, track, instrument):
+        """
+        Load a track and split it into segments.
+
+        With envelope_rate set the segmentation runs on a frame envelope instead of
+        every sample (see frame_envelope), and the levels and the returned envelope hold
+        one value per frame.
 
-        min_seg_length = self.sample_rate * self.min_seg_length_sec
-        max_seg_length = self.sample_rate * self.max_seg_length_sec
-        min_width = self.sample_rate * self.min_width_sec
+        Returns:
+        tuple: (y_power - absolute signal or frame envelope, segments dict, LevelTrack at levels_rate)
+        """
+        self.stats = AnalysisStats()
+        with self.stats.stage('load'):
+            y, self.sample_rate = self.load_audio(track)
+        y_power = np.abs(y)
+        self.stats.count('samples', len(y_power))
 
         print(f"Processing {instrument} - shape: {y.shape}, sample rate: {self.sample_rate}")
         print(f"Minimum  value : {y_power.min()}")
         print(f"Maximum  value : {y_power.max()}")
 
-        self.ref_values = self.get_quantizer_vals(values=y_power, instrument=instrument)
+        with self.stats.stage('reference_levels'):
+            self.ref_values = self.get_quantizer_vals(values=y_power, instrument=instrument, track=track)
 
         # Process segments and quantization
+        if self.envelope_rate:
+            with self.stats.stage('frame_envelope'):
+                samples, (y_power, hop) = y_power, self.frame_envelope(y_power)
+            with self.stats.stage('segmentation'):
+                segments, levels = self.segment_powers(y_power=y_power, instrument=instrument,
+                                                       median_powers=samples, median_scale=hop)
+        else:
+            self.levels_rate = self.sample_rate
+            with self.stats.stage('segmentation'):
+                segments, levels = self.segment_powers(y_power=y_power, instrument=instrument)
+        return y_power, segments, levels
+
+    def frame_envelope(self, y_power):
+        """
+        Reduce the absolute signal to a frame envelope of about envelope_rate frames per second.
+
+        The frame length is the divisor of sample_grid closest to sample_rate / envelope_rate,
+        so frames tile the 0.5 s silence steps, min_width and the segment length exactly and
+        segment boundaries land on the same samples as in the per-sample analysis. Segment
+        powers are means of frame means, the same values up to rounding. Medians can't be
+        combined from frames, and a median of frame medians can quantize to another level
+        than the samples' median - moving the end of the opening silence and with it every
+        later boundary by seconds - so the window medians the segmentation probes are taken
+        from the samples (see segment_powers' median_scale). They are few, a handful per
+        segment. Reported times are exact to one frame (1 / levels_rate s); the last frame
+        of the track may be shorter than the others.
+
+        Returns:
+        tuple: (frame means, frame length in samples) - levels_rate is set to the frame rate
+        """
+        grid = self.sample_grid(self.sample_rate)
+        target = self.sample_rate / self.envelope_rate
+        divisors = [d for d in range(1, math.isqrt(grid) + 1) if grid % d == 0]
+        divisors += [grid // d for d in divisors]
+        hop = min(divisors, key=lambda d: abs(math.log(d / target)))
+        self.levels_rate = self.sample_rate // hop if self.sample_rate % hop == 0 else self.sample_rate / hop
+
+        frames = reduce_windows(y_power, hop, fields=('mean',), partial=True)
+        return np.ascontiguousarray(frames['mean']), hop
+
+    def sample_grid(self, rate):
+        """
+        Largest step that divides the silence step, min_width, its half and the segment
+        lengths at the given rate - every window and boundary the segmentation visits
+        starts on a multiple of it.
+        """
+        min_seg_length = int(rate * self.min_seg_length_sec)
+        min_width = int(rate * self.min_width_sec)
+        return math.gcd(int(0.5 * rate), min_seg_length // 2, min_seg_length, min_width, min_width // 2)
+
+    def load_audio(self, track):
+        if self.audio_cache is not None:
+            return self.audio_cache.load(track)
+        # Imported on first use, librosa takes seconds to import
+        import librosa
+        return librosa.load(track)
+
+    def segment_powers(self, y_power, instrument, median_powers=None, median_scale=1):
+        """
+        Split a power envelope into segments of constant quantized power.
+
+        Segment means are read from an EnvelopeIndex built once for the track, so the
+        cost depends on the number of segments and not on their length. Window medians
+        come from the track's WindowMedians engine (see window_medians).
+
+        Parameters:
+        y_power (np.ndarray): Absolute signal of the track (at levels_rate)
+        instrument (str): Track's instrument
+        median_powers (np.ndarray): Envelope the window medians are taken from, y_power by default
+        median_scale (int): Samples of median_powers per value of y_power - with a frame envelope
+                            as y_power, medians are taken from the absolute signal's samples
+
+        Returns:
+        tuple: (segments dict, LevelTrack - quantized level of every sample as runs)
+        """
+        min_seg_length = self.levels_rate * self.min_seg_length_sec
+        max_seg_length = self.levels_rate * self.max_seg_length_sec
+        min_width = self.levels_rate * self.min_width_sec
+        if median_powers is None:
+            median_powers = y_power
+
+        with self.stats.stage('median_table'):
+            index = EnvelopeIndex(y_power)
+            medians = self.window_medians(median_powers, scale=median_scale)
         segments = {}
-        q = []
+        runs = []
 
-        s = self.remove_opening_silence(powers=y_power, instrument=instrument)
+        with self.stats.stage('opening_silence'):
+            s = self.remove_opening_silence(powers=y_power, instrument=instrument, medians=medians,
+                                            ref_list=self.ref_values)
         e = s + min_seg_length
-        q.extend([0] * s)
+        if s > 0:
+            runs.append((0, 0))
 
         while e < y_power.shape[0]:
             left, right = min_seg_length + s, max_seg_length + s
-            section_power = self.quantize_form_list(y_power[s:s + min_seg_length].mean(), ref_list=self.ref_values)
+            section_power = self.quantize_form_list(index.mean(s, s + min_seg_length), ref_list=self.ref_values)
             while left <= right:
                 mid = (left + right) // 2
-                if (self.quantize_form_list(np.median(y_power[mid - (min_width // 2):mid + (min_width // 2)]),
+                if (self.quantize_form_list(medians.centered(mid, min_width // 2),
                                             ref_list=self.ref_values)
                     == section_power) and (
                         self.check_constant_range(values=y_power[s + min_seg_length:mid + (min_width // 2)], val=section_power,
                                                   step=min_width,
-                                                  ref=self.ref_values)):
+                                                  ref=self.ref_values, medians=medians, offset=s + min_seg_length)):
                     left = mid + 1
                 else:
                     right = mid - 1
@@ -167,58 +367,23 @@ class SongAnalyzer:
             mid = (s + e) // 2
             e = mid
 
-            power = self.quantize_form_list(value=y_power[s:e].mean(), ref_list=self.ref_values)
-            q.extend([power] * (e - s))
+            level = int(quantize_array(index.mean(s, e), self.ref_values, self.number_of_levels))
+            power = level / self.number_of_levels if self.normalize_values else level
+            runs.append((s, level))
             segments[len(segments)] = {"start": self.get_sec_from_sr(s),
                                        "end": self.get_sec_from_sr(e),
                                        "power": power}
             s = e
             e = e + min_seg_length
-        if segments_print:
-            segments_cont = {}
-            start = 0
-            for i,sample in enumerate(q):
-                if q[start] != sample:
-                    segments_cont[len(segments_cont)] = {"start": self.get_sec_from_sr(start),
-                                                         "end": self.get_sec_from_sr(i-1),
-                                                         "power": q[start]}
-                    start = i
-
-            print(segments_cont)
 
-
-        if show_plot:
-            # Match q length to y_power by zero padding
-            if len(q) > y_power.shape[0]:
-                q = q[:-(len(q) - y_power.shape[0])]
-            elif len(q) < y_power.shape[0]:
-                q.extend([0] * (y_power.shape[0] - len(q)))
-            else:
-                pass
-
-            y_norm = y_power / (((self.number_of_levels + 1) / 2) * y_power.mean())
-            data = {
-                'x': range(y_power.shape[0]),
-                'Signal': y_norm,
-                'Quantize Signal': q
-            }
-            df = pd.DataFrame(data)
-            df.plot(x='x', y='Signal', label='OrgSignal ', legend=True)
-            df.plot(x='x', y='Quantize Signal', label='Quantize Signal', legend=True,
-                    ax=plt.gca())  # Use the same axes
-            ticks = self.get_ticks(length=y_power.shape[0])
-            positions, labels = ticks
-            plt.xticks(positions, labels)
-            plt.title(f"{instrument} - Quantize Signal Vs Original")
-            plt.xlabel("Samples")
-            plt.ylabel("Power")
-            plt.grid(True)
-            plt.show()
-
-        return q
+        self.stats.count('median_windows', medians.computed)
+        self.stats.count('segments', len(segments))
+        levels = LevelTrack.from_runs(runs, length=s, rate=self.levels_rate, number_of_levels=self.number_of_levels,
+                                      normalize_values=self.normalize_values)
+        return segments, levels
 
     def get_sec_from_sr(self, sample):
-        return round(sample / self.sample_rate, 3)
+        return round(sample / self.levels_rate, 3)
 
     def calculate_standard_scale(self, instrument):
         """
@@ -240,21 +405,37 @@ class SongAnalyzer:
 
         return list(scale_values)
 
-    def get_quantizer_vals(self, values, instrument):
+    def get_quantizer_vals(self, values, instrument, track=None):
+        """
+        Reference levels of the analyzer's scale for an instrument.
+
+        When track is given the levels are cached per (track, instrument, scale,
+        number_of_levels, sensitivity_power), so analyzing the same track again
+        does not recompute them.
+        """
+        key = self.ref_cache_key(track, instrument)
+        if track is not None and key in self.ref_cache:
+            return self.ref_cache[key]
         if self.scale == 'Normal':
-            return self.calculate_standard_scale(instrument=instrument)
+            ref_values = self.calculate_standard_scale(instrument=instrument)
         elif self.scale == 'Percentile':
             step = len(self.percentile_scale[instrument])//self.number_of_levels
-            return self.percentile_scale[instrument][::step]
-        sorted_values = np.sort(values)
-        index = self.bin_search_index(sorted_values, self.sensitivity_power)
-        step = (len(values) - index) // self.number_of_levels
-        ret_arr = [0]
-        for i in range(1, self.number_of_levels):
-            ret_arr.append(sorted_values[index + (i * step)])
-        return ret_arr
+            ref_values = self.percentile_scale[instrument][::step]
+        else:
+            ref_values = relative_reference_levels(values, number_of_levels=self.number_of_levels,
+                                                   sensitivity_power=self.sensitivity_power)
+        if track is not None:
+            self.ref_cache[key] = ref_values
+        return ref_values
+
+    def ref_cache_key(self, track, instrument):
+        # By content, so a file written again under the same path (e.g. a song separated again) gets new levels
+        if track is not None and os.path.isfile(track):
+            track = content_hash(track)
+        return track, instrument, self.scale, self.number_of_levels, self.sensitivity_power
 
     def quantize_form_list(self, value, ref_list):
+        self.stats.count('quantize_form_list')
         for i, ref in enumerate(ref_list):
             if value < ref:
                 if self.normalize_values:
@@ -264,32 +445,87 @@ class SongAnalyzer:
             return 1
         return self.number_of_levels
 
-    def remove_opening_silence(self, powers, instrument):
-        step = int(0.5 * self.sample_rate)
-        step_w = int(self.min_width_sec * self.sample_rate)
+    def quantize_array(self, values, ref_list):
+        """
+        Vectorized quantize_form_list - quantize a whole envelope in one pass.
+
+        Parameters:
+        values (np.ndarray): Values to quantize
+        ref_list (list): Sorted reference levels (see get_quantizer_vals)
+
+        Returns:
+        np.ndarray: Level of every value, normalized if normalize_values is set
+        """
+        return quantize_array(values, ref_list, number_of_levels=self.number_of_levels,
+                              normalize_values=self.normalize_values)
+
+    def remove_opening_silence(self, powers, instrument, medians=None, ref_list=None):
+        step = int(0.5 * self.levels_rate)
+        step_w = int(self.min_width_sec * self.levels_rate)
+        if medians is None:
+            medians = WindowMedians(powers, width=2 * (step_w // 2), hop=0)
+        if ref_list is None:
+            ref_list = self.get_quantizer_vals(values=powers, instrument=instrument)
         sample = step_w // 2
-        while self.quantize_form_list(np.median(powers[sample - (step_w // 2):sample + (step_w // 2)]),
-                                      ref_list=self.get_quantizer_vals(values=powers, instrument=instrument)) == 0:
+        while self.quantize_form_list(medians.centered(sample, step_w // 2),
+                                      ref_list=ref_list) == 0:
             sample += step
         return sample
 
-    def find_closing_silence(self, powers, instrument):
-        step = int(0.5 * self.sample_rate)
-        step_w = int(self.min_width_sec * self.sample_rate)
+    def find_closing_silence(self, powers, instrument, medians=None, ref_list=None):
+        step = int(0.5 * self.levels_rate)
+        step_w = int(self.min_width_sec * self.levels_rate)
+        if medians is None:
+            medians = WindowMedians(powers, width=2 * (step_w // 2), hop=0)
+        if ref_list is None:
+            ref_list = self.get_quantizer_vals(values=powers, instrument=instrument)
         sample = powers.shape[0] - step_w // 2
-        while self.quantize_form_list(np.median(powers[sample - (step_w // 2):sample + (step_w // 2)]),
-                                      ref_list=self.get_quantizer_vals(values=powers, instrument=instrument)) == 0:
+        while self.quantize_form_list(medians.centered(sample, step_w // 2),
+                                      ref_list=ref_list) == 0:
             sample -= step
         return sample
 
-    def check_constant_range(self, values, val, step, ref):
+    def check_constant_range(self, values, val, step, ref, medians=None, offset=0):
+        """
+        Check that every step-wide window of values quantizes to val.
+
+        When medians (the track's WindowMedians) is given, values must be the slice of the
+        track starting at sample offset, and window medians are read from the engine.
+        """
         i = step // 2
         while i < len(values):
-            if self.quantize_form_list(np.median(values[i - (step // 2):i + (step // 2)]), ref_list=ref) != val:
+            if medians is None:
+                median = np.median(values[i - (step // 2):i + (step // 2)])
+            else:
+                median = medians.window(offset + i - (step // 2), offset + min(i + (step // 2), len(values)))
+            if self.quantize_form_list(median, ref_list=ref) != val:
                 return False
             i += step
         return True
 
+    def window_medians(self, y_power, scale=1):
+        """
+        Build the WindowMedians engine for a track.
+
+        In 'exact' median_mode the hop is the common grid of the windows the silence search
+        and check_constant_range visit, so those are table lookups and every other window is
+        memoized. In 'approximate' mode the hop is median_hop_sec (default min_width_sec)
+        and every full window is snapped to it. With scale > 1, y_power holds `scale`
+        samples per frame of the analyzed envelope and every probed window is memoized.
+        """
+        min_width = int(self.levels_rate * self.min_width_sec)
+        width = 2 * (min_width // 2)
+        if scale > 1:
+            return WindowMedians(y_power, width=width, hop=0, scale=scale)
+        if self.median_mode == 'approximate':
+            hop = int(self.levels_rate * (self.median_hop_sec or self.min_width_sec))
+            return WindowMedians(y_power, width=width, hop=hop, exact=False)
+        hop = self.sample_grid(self.levels_rate)
+        if hop < width // 64:
+            # Grid too fine to precompute, fall back to memoizing the windows on use
+            hop = 0
+        return WindowMedians(y_power, width=width, hop=hop)
+
     @staticmethod
     def bin_search_index(values, ref):
         right = len(values)
@@ -305,49 +541,22 @@ class SongAnalyzer:
 
     @staticmethod
     def plot_array(array, title="Plot of Array", x_ticks=None, log_scale=False):
-        if not isinstance(array, np.ndarray) and not isinstance(array, list):
-            raise TypeError("Input must be a numpy array or list.")
-
-        plt.plot(array)
-        plt.title(title)
-        plt.xlabel("Time")
-        plt.ylabel("Value dB")
-        if log_scale:
-            plt.yscale("log")
-        plt.grid(True)
-        if x_ticks:
-            positions, labels = x_ticks
-            plt.xticks(positions, labels)
-        plt.show()
-
-    def plot_quantized_tracks(self, quantize_tracks, instruments):
-        number_of_samples = max(len(quantize_tracks[i]) for i in instruments)
-
-        # Pad tracks with zeros
-        for instrument in instruments:
-            if len(quantize_tracks[instrument]) < number_of_samples:
-                quantize_tracks[instrument].extend([0] * (number_of_samples - len(quantize_tracks[instrument])))
-
-        # Plotting results
-        data = {'x': range(number_of_samples)}
-        for instrument in instruments:
-            data[instrument] = quantize_tracks[instrument]
+        plotting.show_array(array, title=title, x_ticks=x_ticks, log_scale=log_scale)
 
-        df = pd.DataFrame(data)
-        fig, axes = plt.subplots(nrows=len(instruments), ncols=1, figsize=(6, 15))
+    def plot_path(self, song, name):
+        song = os.path.splitext(os.path.basename(song))[0]
+        return os.path.join(self.plot_dir, f"{song}_{name}.{self.plot_format}")
 
-        ticks = self.get_ticks(number_of_samples)
-        positions, labels = ticks
-
-        for i, ax in enumerate(axes):
-            df.plot(x='x', y=instruments[i], ax=ax, title=f'{instruments[i]}')
-            ax.set_xticks(positions)
-            ax.set_xticklabels(labels)
+    def plot_track(self, y_power, levels, instrument):
+        """
+        Plot a track's quantized signal over its normalized power.
+        """
+        plotting.show_track(y_power, levels, instrument, self.number_of_levels,
+                            ticks=self.get_ticks(length=y_power.shape[0]))
 
-        plt.tight_layout()
-        plt.ylabel('Power')
-        plt.xlabel('Time')
-        plt.show()
+    def plot_quantized_tracks(self, quantize_tracks, instruments):
+        number_of_samples = max(len(quantize_tracks[i]) for i in instruments)
+        plotting.show_quantized_tracks(quantize_tracks, instruments, ticks=self.get_ticks(number_of_samples))
 
     def get_ticks(self, length):
         positions = []
@@ -355,8 +564,20 @@ class SongAnalyzer:
         i = 0
         while i < length:
             positions.append(i)
-            seconds = i // self.sample_rate
+            seconds = int(i // self.levels_rate)
             labels.append(f"{seconds // 60}:{seconds % 60}")
-            i += self.sample_rate * 10
+            i += self.levels_rate * 10
 
         return positions, labels
+
+
+def analyze_stem(analyzer, track, instrument, keep_power=False):
+    """
+    Analyze one stem of SongAnalyzer.run - module level so a process pool can run it.
+
+    Returns:
+    tuple: (segments, LevelTrack, y_power or None, sample rate, levels rate, reference levels, AnalysisStats)
+    """
+    y_power, segments, levels = analyzer.analyze_track(track=track, instrument=instrument)
+    return (segments, levels, y_power if keep_power else None, analyzer.sample_rate, analyzer.levels_rate,
+            analyzer.ref_values, analyzer.stats)
@@ -0,0 +1,50 @@
+import time
+from contextlib import contextmanager
+
+
+class AnalysisStats:
+    """
+    Wall time and call count of every analysis stage of a track, plus named counters.
+
+    Stages nest: a stage timed inside another one counts in both (segmentation
+    includes opening_silence, for example).
+    """
+
+    def __init__(self):
+        self.stages = {}  # name -> {'seconds': wall time, 'calls': number of calls}
+        self.counters = {}  # name -> count
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            stage['seconds'] += time.perf_counter() - start
+            stage['calls'] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other):
+        """
+        Add the stages and counters of another AnalysisStats to this one.
+        """
+        for name, other_stage in other.stages.items():
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            stage['seconds'] += other_stage['seconds']
+            stage['calls'] += other_stage['calls']
+        for name, n in other.counters.items():
+            self.count(name, n)
+        return self
+
+    def as_dict(self):
+        """
+        Plain dict copy of the stats, ready for json.dumps or a metrics system.
+
+        Returns:
+        dict: {'stages': {name: {'seconds', 'calls'}}, 'counters': {name: count}}
+        """
+        return {'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'counters': dict(self.counters)}
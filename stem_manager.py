@@ -0,0 +1,176 @@
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_cache import content_hash
+
+STEMS = ['bass', 'drums', 'vocals', 'other']
+DEFAULT_STEMS_DIR = '.stems'
+DEMUCS_COMMAND = 'demucs --mp3 -o {out_dir} {source}'
+LEGACY_DIR = os.path.join('separated', 'htdemucs')
+
+# One lock per source hash, so a source is never separated twice at the same time
+_locks_guard = threading.Lock()
+_source_locks = {}
+
+
+def source_lock(key):
+    with _locks_guard:
+        return _source_locks.setdefault(key, threading.Lock())
+
+
+class StemManager:
+    """
+    Separated stems of source tracks, kept by the source's content hash.
+
+    Stems of a source live in <stems_dir>/<content hash>/<stem>.mp3 next to a meta.json,
+    so a changed source gets new stems and an unchanged one (under any name) reuses them.
+    Separation runs `command` with {source} and {out_dir} filled in - demucs by default,
+    any command that writes <stem>.mp3 files somewhere under out_dir works. At most
+    max_concurrent separations run at once.
+    """
+
+    def __init__(self, stems_dir=DEFAULT_STEMS_DIR, command=DEMUCS_COMMAND, max_concurrent=1, stems=STEMS,
+                 legacy_dir=LEGACY_DIR):
+        self.stems_dir = stems_dir
+        self.command = command
+        self.max_concurrent = max_concurrent
+        self.stems = stems
+        self.legacy_dir = legacy_dir  # demucs' own output folder, used when a source was never separated here
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+
+    def __getstate__(self):
+        # Semaphores can't be pickled, each process limits its own separations
+        state = self.__dict__.copy()
+        del state['slots']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.slots = threading.BoundedSemaphore(self.max_concurrent)
+
+    def stem_dir(self, source):
+        return os.path.join(self.stems_dir, content_hash(source))
+
+    def cached(self, source):
+        """
+        Stem paths of a source separated before, None if it wasn't.
+        """
+        stem_dir = self.stem_dir(source)
+        paths = {stem: os.path.join(stem_dir, f"{stem}.mp3") for stem in self.stems}
+        if os.path.exists(os.path.join(stem_dir, 'meta.json')) and all(map(os.path.exists, paths.values())):
+            return paths
+        return None
+
+    def legacy(self, source):
+        """
+        Adopt the stems in demucs' separated/htdemucs/<song>/ folder, None if any is missing.
+
+        Their content can't be checked against the source. Stems newer than the source file are
+        copied into the stems folder under the source's current hash, with a meta.json marking
+        them as adopted, so they are used only while the source's content stays the same. Stems
+        older than the source file may be separated from an earlier version of it: they are
+        used where they are, with a warning, and never adopted.
+        """
+        song_name = os.path.splitext(os.path.basename(source))[0]
+        paths = {stem: os.path.join(self.legacy_dir, song_name, f"{stem}.mp3") for stem in self.stems}
+        if not all(map(os.path.exists, paths.values())):
+            return None
+        if min(os.path.getmtime(path) for path in paths.values()) < os.path.getmtime(source):
+            print(f"Warning: the stems in {os.path.dirname(paths[self.stems[0]])} are older than {source}, "
+                  f"they may be from an earlier version of it - separate=True separates it again")
+            return paths
+        print(f"Warning: using unverified stems from {os.path.dirname(paths[self.stems[0]])} for {source}")
+
+        key = content_hash(source)
+        with source_lock(key):
+            stem_dir = self.stem_dir(source)
+            os.makedirs(stem_dir, exist_ok=True)
+            for stem, path in paths.items():
+                tmp_path = os.path.join(stem_dir, f"{stem}.mp3.{os.getpid()}.tmp")
+                shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, os.path.join(stem_dir, f"{stem}.mp3"))
+            # meta.json last - its presence marks the stems as complete
+            with open(os.path.join(stem_dir, 'meta.json'), 'w') as f:
+                json.dump({'source': os.path.abspath(source), 'hash': key, 'command': None,
+                           'adopted_from': os.path.abspath(os.path.dirname(paths[self.stems[0]])),
+                           'created': time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+        return self.cached(source)
+
+    def separate(self, source):
+        """
+        Separate a source unless its stems are already cached.
+
+        Returns:
+        dict: stem -> path
+        """
+        key = content_hash(source)
+        with source_lock(key):
+            paths = self.cached(source)
+            if paths is not None:
+                return paths
+
+            stem_dir = self.stem_dir(source)
+            out_dir = f"{stem_dir}.{os.getpid()}.tmp"
+            os.makedirs(out_dir, exist_ok=True)
+            try:
+                args = [arg.format(source=source, out_dir=out_dir) for arg in shlex.split(self.command)]
+                start = time.perf_counter()
+                with self.slots:
+                    subprocess.run(args, check=True)
+                seconds = time.perf_counter() - start
+
+                found = {}
+                for root, _, files in os.walk(out_dir):
+                    for stem in self.stems:
+                        if f"{stem}.mp3" in files:
+                            found[stem] = os.path.join(root, f"{stem}.mp3")
+                missing = [stem for stem in self.stems if stem not in found]
+                if missing:
+                    raise RuntimeError(f"Separating {source} produced no {', '.join(missing)} stems")
+
+                os.makedirs(stem_dir, exist_ok=True)
+                for stem, path in found.items():
+                    os.replace(path, os.path.join(stem_dir, f"{stem}.mp3"))
+                # meta.json last - its presence marks the stems as complete
+                with open(os.path.join(stem_dir, 'meta.json'), 'w') as f:
+                    json.dump({'source': os.path.abspath(source), 'hash': key, 'command': self.command,
+                               'seconds': round(seconds, 3), 'created': time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+            finally:
+                shutil.rmtree(out_dir, ignore_errors=True)
+            return self.cached(source)
+
+    def separate_many(self, sources):
+        """
+        Separate sources concurrently, up to max_concurrent at a time.
+
+        Returns:
+        dict: source -> {stem: path}
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrent) as pool:
+            return dict(zip(sources, pool.map(self.separate, sources)))
+
+    def stem_paths(self, source, separate=True):
+        """
+        Paths of a source's stems and of the source itself (as 'main').
+
+        Parameters:
+        source (str): Source track
+        separate (bool): Separate the source if it has no cached stems
+
+        Returns:
+        dict: stem -> path, plus 'main'
+        """
+        paths = self.cached(source)
+        if paths is None and separate:
+            paths = self.separate(source)
+        if paths is None:
+            paths = self.legacy(source)
+        if paths is None:
+            raise FileNotFoundError(f"No stems for {source}, analyze it with separate=True")
+        return {**paths, 'main': source}
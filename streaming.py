@@ -0,0 +1,325 @@
+import numpy as np
+
+from quantizer import threshold_index
+
+# MP3 frames hold 1152 samples, reading in whole frames keeps chunked decoding
+# identical to decoding the file at once
+STREAM_HOP = 1152 * 4
+
+
+def stream_blocks(track, sr=22050, block_sec=30):
+    """
+    Read a track block by block - the streaming counterpart of librosa.load(track, sr=sr).
+
+    Blocks are mixed down to mono with librosa.stream and resampled with a streaming
+    soxr resampler (the one librosa.load uses), so the concatenated blocks are the
+    samples librosa.load returns.
+
+    Parameters:
+    track (str): Audio file
+    sr (int): Target sample rate, None keeps the file's rate
+    block_sec (float): Approximate block length in seconds
+
+    Yields:
+    np.ndarray: float32 mono block
+    """
+    import librosa
+
+    native_sr = librosa.get_samplerate(track)
+    block_length = max(1, int(block_sec * native_sr) // STREAM_HOP)
+    resampler = None
+    if sr is not None and sr != native_sr:
+        import soxr
+        resampler = soxr.ResampleStream(native_sr, sr, 1, dtype='float32', quality='HQ')
+
+    for block in librosa.stream(track, block_length=block_length, frame_length=STREAM_HOP,
+                                hop_length=STREAM_HOP, mono=True):
+        yield resampler.resample_chunk(block) if resampler else block
+    if resampler:
+        yield resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+
+def stream_reference_levels(blocks, number_of_levels, sensitivity_power=0.001):
+    """
+    Relative scale reference levels of a streamed track, in bounded memory.
+
+    Gives the same levels as quantizer.relative_reference_levels on the whole track.
+    Non-negative float32 values sort like their bit patterns, so the order statistics
+    are found with a two-pass radix selection: the first pass histograms the high 16
+    bits of every value, the second histograms the low 16 bits of the values that
+    fall in the buckets holding the wanted ranks.
+
+    Parameters:
+    blocks (callable): Returns a new iterator over the track's power blocks on every call
+    number_of_levels (int): Number of levels
+    sensitivity_power (float): Values below it are ignored as silence
+
+    Returns:
+    list: Sorted reference levels starting with 0
+    """
+    length = 0
+    below = 0
+    high_counts = np.zeros(1 << 16, dtype=np.int64)
+    for powers in blocks():
+        powers = np.asarray(powers, dtype=np.float32)
+        length += len(powers)
+        below += np.count_nonzero(powers < sensitivity_power)
+        high_counts += np.bincount(powers.view(np.uint32) >> 16, minlength=1 << 16)
+
+    index = threshold_index(length, below)
+    step = (length - index) // number_of_levels
+    kth = [index + (i * step) for i in range(1, number_of_levels)]
+    if not kth:
+        return [0]
+
+    high_cumulative = np.cumsum(high_counts)
+    high_buckets = np.searchsorted(high_cumulative, kth, side='right')
+    low_counts = {bucket: np.zeros(1 << 16, dtype=np.int64) for bucket in set(high_buckets.tolist())}
+    for powers in blocks():
+        bits = np.asarray(powers, dtype=np.float32).view(np.uint32)
+        high = bits >> 16
+        for bucket, counts in low_counts.items():
+            counts += np.bincount(bits[high == bucket] & 0xFFFF, minlength=1 << 16)
+
+    ret_arr = [0]
+    for k, bucket in zip(kth, high_buckets.tolist()):
+        rank = k - (high_cumulative[bucket - 1] if bucket else 0)
+        low = np.searchsorted(np.cumsum(low_counts[bucket]), rank, side='right')
+        ret_arr.append(np.array([(bucket << 16) | low], dtype=np.uint32).view(np.float32)[0])
+    return ret_arr
+
+
+class StreamingSegmenter:
+    """
+    Block-by-block version of SongAnalyzer.segment_powers.
+
+    Keeps only the samples of the current silence window and the running sum of the
+    envelope, so memory does not grow with the recording. Feed power blocks with push,
+    which returns the segments that became final, then call finish.
+
+    The segment boundaries of segment_powers only depend on the opening silence and
+    min_seg_length (its binary search does not move them), so this reproduces them
+    without buffering max_seg_length of samples for the search.
+
+    A recording's last segment only exists if min_seg_length more samples follow it,
+    so segment_powers' results are only final min_seg_length after a segment starts.
+    With live=True there is no end of recording to wait for: a segment is emitted as
+    soon as its end boundary is pushed, and ref_list may be replaced between pushes.
+    """
+
+    def __init__(self, analyzer, ref_list, live=False):
+        self.analyzer = analyzer
+        self.ref_list = ref_list
+        self.live = live
+        sample_rate = analyzer.levels_rate
+        self.min_seg_length = sample_rate * analyzer.min_seg_length_sec
+        self.seg_length = self.min_seg_length // 2
+        self.silence_step = int(0.5 * sample_rate)
+        self.half_width = int(analyzer.min_width_sec * sample_rate) // 2
+
+        self.position = 0  # samples pushed so far
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_start = 0
+        self.buffer_sum = 0.0  # sum of all samples before buffer_start
+        self.center = self.half_width  # opening silence window center
+        self.start = None  # end of the opening silence
+        self.boundary_sums = []  # envelope sum up to every segment boundary seen
+        self.segments = {}
+
+    def push(self, powers):
+        """
+        Add the next block of the power envelope.
+
+        Returns:
+        list: Segments that became final with this block
+        """
+        self.buffer = np.concatenate((self.buffer, np.asarray(powers, dtype=np.float32)))
+        self.position += len(powers)
+        if self.start is None:
+            self.find_start(final=False)
+        if self.start is not None:
+            self.record_boundaries()
+        return self.emit()
+
+    def finish(self):
+        """
+        Close the stream.
+
+        Returns:
+        list: Segments that became final at the end of the stream
+        """
+        if self.start is None:
+            self.find_start(final=True)
+        return self.emit()
+
+    def find_start(self, final):
+        # Same 0.5 s steps and windows as SongAnalyzer.remove_opening_silence
+        while self.center + self.half_width <= self.position or final:
+            lo = self.center - self.half_width - self.buffer_start
+            window = self.buffer[lo:lo + 2 * self.half_width]
+            if self.analyzer.quantize_form_list(np.median(window), ref_list=self.ref_list) != 0:
+                self.start = self.center
+                return
+            self.center += self.silence_step
+            self.trim(self.center - self.half_width)
+
+    def record_boundaries(self):
+        boundary = self.start + len(self.boundary_sums) * self.seg_length
+        if boundary > self.position:
+            return
+        # Sequential float64 running sum - the same values as EnvelopeIndex's cumsum
+        sums = np.cumsum(np.concatenate(([self.buffer_sum], self.buffer)), dtype=np.float64)
+        while boundary <= self.position:
+            self.boundary_sums.append(sums[boundary - self.buffer_start])
+            boundary += self.seg_length
+        self.trim(self.position, sums[-1])
+
+    def trim(self, start, buffer_sum=None):
+        drop = min(start, self.position) - self.buffer_start
+        if drop <= 0:
+            return
+        if buffer_sum is None:
+            buffer_sum = np.cumsum(np.concatenate(([self.buffer_sum], self.buffer[:drop])), dtype=np.float64)[-1]
+        self.buffer = self.buffer[drop:]
+        self.buffer_start += drop
+        self.buffer_sum = buffer_sum
+
+    def emit(self):
+        new_segments = []
+        if self.start is None:
+            return new_segments
+        while True:
+            j = len(self.segments)
+            s = self.start + j * self.seg_length
+            if j + 1 >= len(self.boundary_sums):
+                return new_segments
+            # segment_powers keeps a segment while s + min_seg_length < track length
+            if not self.live and s + self.min_seg_length >= self.position:
+                return new_segments
+            e = s + self.seg_length
+            mean = (self.boundary_sums[j + 1] - self.boundary_sums[j]) / (e - s)
+            segment = {"start": self.analyzer.get_sec_from_sr(s),
+                       "end": self.analyzer.get_sec_from_sr(e),
+                       "power": self.analyzer.quantize_form_list(value=mean, ref_list=self.ref_list)}
+            self.segments[j] = segment
+            new_segments.append(segment)
+
+
+class LevelSketch:
+    """
+    Histogram of power values over their float32 bit patterns, for approximate Relative levels.
+
+    Non-negative float32 values sort like their bit patterns, the high 16 bits (sign,
+    exponent and 7 mantissa bits) give buckets less than 1% wide at any magnitude. Each
+    reference level is read as the middle of the bucket holding its rank. With half_life_sec
+    set older values fade out (their weight halves every half_life_sec of pushed audio),
+    so the levels follow a live mix.
+    """
+
+    def __init__(self, number_of_levels, sensitivity_power=0.001, half_life_sec=None, sample_rate=22050):
+        self.number_of_levels = number_of_levels
+        self.sensitivity_power = sensitivity_power
+        self.half_life = half_life_sec * sample_rate if half_life_sec else None
+        self.counts = np.zeros(1 << 16, dtype=np.float64)
+        self.below = 0.0  # weight of the values below sensitivity_power
+
+    def add(self, powers):
+        powers = np.asarray(powers, dtype=np.float32)
+        if self.half_life:
+            decay = 0.5 ** (len(powers) / self.half_life)
+            self.counts *= decay
+            self.below *= decay
+        self.below += np.count_nonzero(powers < self.sensitivity_power)
+        self.counts += np.bincount(powers.view(np.uint32) >> 16, minlength=1 << 16)
+
+    def merge(self, other):
+        """
+        Add the values of another sketch (with the same sensitivity_power) to this one.
+        """
+        self.counts += other.counts
+        self.below += other.below
+        return self
+
+    def quantiles(self, fractions):
+        """
+        Quantiles of the values above sensitivity_power, None if there are none.
+
+        Returns:
+        list: Value at every fraction (0 - 1) of the ordered values, to the sketch's precision
+        """
+        cumulative = np.cumsum(self.counts)
+        total = cumulative[-1]
+        if total - self.below <= 0:
+            return None
+        kth = [self.below + (fraction * (total - self.below)) for fraction in fractions]
+        last = np.flatnonzero(self.counts)[-1]
+        buckets = np.searchsorted(cumulative, kth, side='right').clip(0, last)
+        middles = ((buckets.astype(np.uint32) << 16) | 0x8000).view(np.float32)
+        return middles.tolist()
+
+    def reference_levels(self):
+        """
+        Returns:
+        list: Sorted reference levels starting with 0, like relative_reference_levels
+        """
+        levels = self.quantiles([i / self.number_of_levels for i in range(1, self.number_of_levels)])
+        if levels is None:
+            # Only silence so far, everything stays at level 0
+            return [0] + [np.inf] * (self.number_of_levels - 1)
+        return [0] + levels
+
+
+class OnlineAnalyzer:
+    """
+    Incremental analysis of live audio.
+
+    Push audio blocks as they arrive, each push returns the segments (start, end, power)
+    that became final with it. Segments are those of StreamingSegmenter in live mode: a
+    segment is final as soon as its end is pushed, and the opening silence is known
+    min_width_sec / 2 after it ends, so no result waits longer than min_width_sec.
+
+    Normal and Percentile scales use their fixed reference levels. The Relative scale can't
+    see the whole track, its levels come from a LevelSketch of everything pushed so far,
+    recomputed after every block (half_life_sec lets them follow changes in the mix).
+    """
+
+    def __init__(self, analyzer, instrument='main', sample_rate=22050, half_life_sec=120):
+        self.analyzer = analyzer
+        analyzer.sample_rate = sample_rate
+        analyzer.levels_rate = sample_rate
+
+        self.sketch = None
+        ref_list = None
+        if analyzer.scale in ('Normal', 'Percentile'):
+            ref_list = analyzer.get_quantizer_vals(values=None, instrument=instrument)
+        else:
+            self.sketch = LevelSketch(analyzer.number_of_levels, sensitivity_power=analyzer.sensitivity_power,
+                                      half_life_sec=half_life_sec, sample_rate=sample_rate)
+        self.segmenter = StreamingSegmenter(analyzer=analyzer, ref_list=ref_list, live=True)
+
+    @property
+    def ref_list(self):
+        return self.segmenter.ref_list
+
+    @property
+    def segments(self):
+        return self.segmenter.segments
+
+    def push(self, block):
+        """
+        Add the next block of audio.
+
+        Parameters:
+        block (np.ndarray): Audio samples at sample_rate, (samples, channels) blocks are mixed down
+
+        Returns:
+        list: Segments that became final with this block
+        """
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim > 1:
+            block = block.mean(axis=1)
+        powers = np.abs(block)
+        if self.sketch is not None:
+            self.sketch.add(powers)
+            self.segmenter.ref_list = self.sketch.reference_levels()
+        return self.segmenter.push(powers)
@@ -0,0 +1,8 @@
+from benchmark_analyzer import IMPORT_BUDGET_SEC, check_import
+
+
+def test_song_analyzer_import_budget():
+    # check_import times "import song_analyzer" in fresh interpreters, so this process's imports don't count
+    seconds, heavy, problems = check_import()
+    assert heavy == [], problems
+    assert seconds < IMPORT_BUDGET_SEC, problems
@@ -0,0 +1,137 @@
+import json
+import os
+import sys
+
+import pytest
+
+from stem_manager import STEMS, StemManager
+
+# Stands in for demucs: writes <stem>.mp3 files holding the stem name and the source's bytes,
+# and logs when it starts and ends
+STUB = '''
+import os, sys, time
+source, out_dir, log, seconds = sys.argv[1:5]
+with open(log, 'a') as f:
+    f.write(f"start {time.time()}\\n")
+time.sleep(float(seconds))
+song_dir = os.path.join(out_dir, 'htdemucs', os.path.splitext(os.path.basename(source))[0])
+os.makedirs(song_dir)
+with open(source, 'rb') as f:
+    data = f.read()
+for stem in ('bass', 'drums', 'vocals', 'other'):
+    with open(os.path.join(song_dir, stem + '.mp3'), 'wb') as f:
+        f.write(stem.encode() + data)
+with open(log, 'a') as f:
+    f.write(f"end {time.time()}\\n")
+'''
+
+
+def make_manager(tmp_path, seconds=0, **kwargs):
+    stub = tmp_path / 'stub_separator.py'
+    stub.write_text(STUB)
+    command = f'"{sys.executable}" "{stub}" {{source}} {{out_dir}} "{tmp_path / "log.txt"}" {seconds}'
+    return StemManager(stems_dir=str(tmp_path / 'stems'), command=command,
+                       legacy_dir=str(tmp_path / 'separated' / 'htdemucs'), **kwargs)
+
+
+def runs(tmp_path):
+    log = tmp_path / 'log.txt'
+    if not log.exists():
+        return []
+    return [line.split() for line in log.read_text().splitlines()]
+
+
+def write_song(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_same_content_is_separated_once(tmp_path):
+    manager = make_manager(tmp_path)
+    song = write_song(tmp_path / 'song.mp3', b'first take')
+
+    paths = manager.stem_paths(song)
+    assert paths['main'] == song
+    assert read(paths['bass']) == b'bass' + b'first take'
+    assert manager.stem_paths(song) == paths
+    # The same content under another name is the same source
+    copy = write_song(tmp_path / 'copy.mp3', b'first take')
+    assert manager.stem_paths(copy)['vocals'] == paths['vocals']
+    assert len([run for run in runs(tmp_path) if run[0] == 'start']) == 1
+
+
+def test_changed_source_is_separated_again(tmp_path):
+    manager = make_manager(tmp_path)
+    song = write_song(tmp_path / 'song.mp3', b'first take')
+    first = manager.stem_paths(song)
+
+    write_song(tmp_path / 'song.mp3', b'second, longer take')
+    second = manager.stem_paths(song)
+    assert second['drums'] != first['drums']
+    assert read(second['drums']) == b'drums' + b'second, longer take'
+    assert len([run for run in runs(tmp_path) if run[0] == 'start']) == 2
+
+
+def write_legacy(tmp_path, song, mtime):
+    song_dir = tmp_path / 'separated' / 'htdemucs' / os.path.splitext(os.path.basename(song))[0]
+    song_dir.mkdir(parents=True)
+    for stem in STEMS:
+        path = song_dir / f"{stem}.mp3"
+        path.write_bytes(b'legacy ' + stem.encode())
+        os.utime(path, (mtime, mtime))
+    return song_dir
+
+
+def test_newer_legacy_stems_are_adopted(tmp_path):
+    manager = make_manager(tmp_path)
+    song = write_song(tmp_path / 'song.mp3', b'first take')
+    legacy_dir = write_legacy(tmp_path, song, os.path.getmtime(song) + 60)
+
+    paths = manager.stem_paths(song, separate=False)
+    assert os.path.dirname(paths['bass']) == manager.stem_dir(song)
+    assert read(paths['bass']) == b'legacy bass'
+    with open(os.path.join(manager.stem_dir(song), 'meta.json')) as f:
+        assert json.load(f)['adopted_from'] == str(legacy_dir)
+    assert manager.cached(song) == {stem: paths[stem] for stem in STEMS}
+    assert runs(tmp_path) == []
+
+
+def test_older_legacy_stems_are_read_in_place(tmp_path):
+    manager = make_manager(tmp_path)
+    song = write_song(tmp_path / 'song.mp3', b'first take')
+    legacy_dir = write_legacy(tmp_path, song, os.path.getmtime(song) - 60)
+
+    paths = manager.stem_paths(song, separate=False)
+    assert paths['other'] == str(legacy_dir / 'other.mp3')
+    assert manager.cached(song) is None
+    # separate=True doesn't read them, it separates the song
+    assert read(manager.stem_paths(song)['other']) == b'other' + b'first take'
+
+
+def test_missing_stems_without_separating(tmp_path):
+    manager = make_manager(tmp_path)
+    song = write_song(tmp_path / 'song.mp3', b'first take')
+    with pytest.raises(FileNotFoundError):
+        manager.stem_paths(song, separate=False)
+
+
+def test_separate_many_runs_at_most_max_concurrent(tmp_path):
+    manager = make_manager(tmp_path, seconds=0.5, max_concurrent=2)
+    songs = [write_song(tmp_path / f"song{i}.mp3", f"take {i}".encode()) for i in range(4)]
+
+    stems = manager.separate_many(songs)
+    assert sorted(stems) == sorted(songs)
+    assert all(read(stems[song]['vocals']) == b'vocals' + read(song) for song in songs)
+
+    events = sorted((float(time), 1 if event == 'start' else -1) for event, time in runs(tmp_path))
+    running, most = 0, 0
+    for _, change in events:
+        running += change
+        most = max(most, running)
+    assert len(events) == 8
+    assert most == 2
@@ -0,0 +1,77 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FIELDS = ('sliced', 'mean', 'median', 'max', 'rms')
+
+
+def window_view(signal, window, hop=None):
+    """
+    Full windows of a signal as a (windows, window) view - nothing is copied.
+
+    Parameters:
+    signal (np.ndarray): 1D signal
+    window (int): Window length in samples
+    hop (int): Samples between window starts, window (back to back windows) by default
+
+    Returns:
+    np.ndarray: Row k holds signal[k * hop:k * hop + window]
+    """
+    signal = np.asarray(signal)
+    hop = window if hop is None else hop
+    if len(signal) < window:
+        return signal[:0].reshape(0, window)
+    if hop == window:
+        return signal[:len(signal) // window * window].reshape(-1, window)
+    return sliding_window_view(signal, window)[::hop]
+
+
+def reduce_windows(signal, window, hop=None, fields=FIELDS, partial=False):
+    """
+    Reduce every window of a signal to the requested fields.
+
+    Windows are read through window_view, without copying the signal, and every field is
+    computed for all windows at once. rms keeps the analysis' definition, sqrt(mean(window))
+    of the absolute signal, so it is taken from the mean.
+
+    Parameters:
+    signal (np.ndarray): 1D signal, usually the absolute signal y_power
+    window (int): Window length in samples
+    hop (int): Samples between window starts, window by default
+    fields (tuple): Any of FIELDS - sliced is the window's first sample
+    partial (bool): Also reduce the windows that run past the end of the signal, cut at the end
+
+    Returns:
+    np.ndarray: Structured array with one row per window and one field per requested field
+    """
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown window fields {unknown}, expected any of {FIELDS}")
+    signal = np.asarray(signal)
+    hop = window if hop is None else hop
+    dtype = signal.dtype if np.issubdtype(signal.dtype, np.floating) else np.float64
+
+    views = [window_view(signal, window, hop)]
+    if partial:
+        # Windows starting after the last full one, one row each
+        views += [signal[start:start + window][np.newaxis] for start in range(len(views[0]) * hop, len(signal), hop)]
+
+    result = np.zeros(sum(len(view) for view in views), dtype=[(field, dtype) for field in fields])
+    row = 0
+    for view in views:
+        rows = slice(row, row + len(view))
+        row += len(view)
+        if not len(view):
+            continue
+        if 'sliced' in fields:
+            result['sliced'][rows] = view[:, 0]
+        if 'mean' in fields or 'rms' in fields:
+            means = view.mean(axis=1)
+            if 'mean' in fields:
+                result['mean'][rows] = means
+            if 'rms' in fields:
+                result['rms'][rows] = np.sqrt(means)
+        if 'median' in fields:
+            result['median'][rows] = np.median(view, axis=1)
+        if 'max' in fields:
+            result['max'][rows] = view.max(axis=1)
+    return result
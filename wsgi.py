@@ -0,0 +1,5 @@
+from interface_flow import create_app
+
+# WSGI entry point, e.g. gunicorn -w 8 -b 0.0.0.0:8000 wsgi:app
+# Settings come from INTERFACE_FLOW_<ARGUMENT> environment variables, see interface_flow.parse_args
+app = create_app()